@@ -1,10 +1,87 @@
-import json
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from supabase_db import json_dumps_bytes, json_loads
+
 
 GRAPH_VER = "v24.0"
 
+# Session partagée (keep-alive): évite un handshake TCP+TLS par appel Graph.
+# Retry: erreurs de connexion + 5xx/429 sur GET seulement (urllib3 ne rejoue
+# pas les POST sur statut -> pas de double publication).
+FB_POOL_SIZE = int(os.getenv("KENBOT_FB_POOL_SIZE", "16").strip() or "16")
+
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=FB_POOL_SIZE,
+    pool_maxsize=FB_POOL_SIZE,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        raise_on_status=False,
+    ),
+)
+SESSION.mount("https://", _ADAPTER)
+
+# Usage des quotas Graph (% max des compteurs) exposé par la dernière réponse qui
+# portait les headers X-App-Usage / X-Page-Usage / X-Business-Use-Case-Usage.
+_USAGE_HEADERS = ("X-App-Usage", "X-Page-Usage", "X-Business-Use-Case-Usage")
+_USAGE_KEYS = ("call_count", "total_cputime", "total_time")
+_last_usage_pct: Optional[float] = None
+
+
+def _track_usage(resp: requests.Response, *args: Any, **kwargs: Any) -> requests.Response:
+    global _last_usage_pct
+    pct: Optional[float] = None
+    for h in _USAGE_HEADERS:
+        raw = resp.headers.get(h)
+        if not raw:
+            continue
+        try:
+            data = json_loads(raw)
+        except Exception:
+            continue
+        if not isinstance(data, dict):
+            continue
+        # X-Business-Use-Case-Usage: {business_id: [{...}, ...]}; les autres: {...}
+        items = [data]
+        for v in data.values():
+            if isinstance(v, list):
+                items.extend(x for x in v if isinstance(x, dict))
+        for it in items:
+            for k in _USAGE_KEYS:
+                v = it.get(k)
+                if isinstance(v, (int, float)):
+                    pct = max(pct or 0.0, float(v))
+    if pct is not None:
+        _last_usage_pct = pct
+    return resp
+
+
+SESSION.hooks["response"].append(_track_usage)
+
+
+def fb_usage_pct() -> Optional[float]:
+    """% d'usage Graph le plus élevé vu sur la dernière réponse (None si jamais exposé)."""
+    return _last_usage_pct
+
+# Throttling Graph: 429 / 5xx, ou codes d'erreur de rate limit (souvent en HTTP 400/403)
+FB_MAX_RETRIES = int(os.getenv("KENBOT_FB_MAX_RETRIES", "4").strip() or "4")
+FB_MAX_BACKOFF = int(os.getenv("KENBOT_FB_MAX_BACKOFF", "60").strip() or "60")
+_THROTTLE_CODES = {4, 17, 32, 613}
+
+# Uploads de photos (unpublished) en parallèle pour un même post
+FB_UPLOAD_WORKERS = int(os.getenv("KENBOT_FB_UPLOAD_WORKERS", "4").strip() or "4")
+
 
 def _graph(url: str) -> str:
     return f"https://graph.facebook.com/{GRAPH_VER}/{url.lstrip('/')}"
@@ -12,11 +89,76 @@ def _graph(url: str) -> str:
 
 def _json_or_text(resp: requests.Response) -> Dict[str, Any]:
     try:
-        return resp.json()
+        return json_loads(resp.content)
     except Exception:
         return {"raw": resp.text}
 
 
+def _media_fbid_json(mid: str) -> str:
+    return json_dumps_bytes({"media_fbid": mid}).decode("utf-8")
+
+
+def _is_throttled(resp: requests.Response, payload: Dict[str, Any]) -> bool:
+    if resp.status_code == 429 or resp.status_code >= 500:
+        return True
+    err = (payload or {}).get("error") or {}
+    return isinstance(err, dict) and err.get("code") in _THROTTLE_CODES
+
+
+def _post_with_backoff(url: str, **kwargs: Any) -> requests.Response:
+    """
+    POST idempotent avec backoff exponentiel (+ jitter) quand Graph throttle.
+    Respecte Retry-After s'il est fourni. Ne pas utiliser pour les créations.
+    """
+    attempt = 0
+    while True:
+        resp = SESSION.post(url, **kwargs)
+        if resp.ok or attempt >= FB_MAX_RETRIES or not _is_throttled(resp, _json_or_text(resp)):
+            return resp
+
+        retry_after = (resp.headers.get("Retry-After") or "").strip()
+        if retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = (2 ** attempt) + random.uniform(0, 1)
+        time.sleep(min(FB_MAX_BACKOFF, delay))
+        attempt += 1
+
+
+def _upload_unpublished_photo(page_id: str, token: str, p: Path, what: str = "photo") -> str:
+    url = _graph(f"{page_id}/photos")
+    with open(p, "rb") as f:
+        resp = SESSION.post(
+            url,
+            params={"access_token": token},
+            data={"published": "false"},
+            files={"source": f},
+            timeout=120,
+        )
+
+    payload = _json_or_text(resp)
+    if not resp.ok:
+        raise RuntimeError(f"FB upload {what} failed {resp.status_code}: {payload}")
+
+    mid = payload.get("id")
+    if not mid:
+        raise RuntimeError(f"FB upload {what} missing id: {payload}")
+
+    return mid
+
+
+def _upload_unpublished_photos(page_id: str, token: str, photo_paths: List[Path], what: str = "photo") -> List[str]:
+    """
+    Uploads en parallèle (FB_UPLOAD_WORKERS), IDs retournés dans l'ordre des photos.
+    La première erreur (dans l'ordre) est relancée, comme en séquentiel.
+    """
+    if len(photo_paths) <= 1 or FB_UPLOAD_WORKERS <= 1:
+        return [_upload_unpublished_photo(page_id, token, p, what) for p in photo_paths]
+
+    with ThreadPoolExecutor(max_workers=min(FB_UPLOAD_WORKERS, len(photo_paths))) as pool:
+        return list(pool.map(lambda p: _upload_unpublished_photo(page_id, token, p, what), photo_paths))
+
+
 def publish_photos_unpublished(
     page_id: str,
     token: str,
@@ -25,31 +167,9 @@ def publish_photos_unpublished(
 ) -> List[str]:
     """
     Upload photos as unpublished to get media_fbid IDs.
-    Returns list of media IDs.
+    Returns list of media IDs (same order as photo_paths).
     """
-    media_ids: List[str] = []
-    for p in photo_paths[:limit]:
-        url = _graph(f"{page_id}/photos")
-        with open(p, "rb") as f:
-            resp = requests.post(
-                url,
-                params={"access_token": token},
-                data={"published": "false"},
-                files={"source": f},
-                timeout=120,
-            )
-
-        payload = _json_or_text(resp)
-        if not resp.ok:
-            raise RuntimeError(f"FB upload photo failed {resp.status_code}: {payload}")
-
-        mid = payload.get("id")
-        if not mid:
-            raise RuntimeError(f"FB upload photo missing id: {payload}")
-
-        media_ids.append(mid)
-
-    return media_ids
+    return _upload_unpublished_photos(page_id, token, photo_paths[:limit], what="photo")
 
 
 def create_post_with_attached_media(
@@ -66,9 +186,9 @@ def create_post_with_attached_media(
     data: Dict[str, str] = {"message": message}
 
     for i, mid in enumerate(media_ids):
-        data[f"attached_media[{i}]"] = json.dumps({"media_fbid": mid})
+        data[f"attached_media[{i}]"] = _media_fbid_json(mid)
 
-    resp = requests.post(url, params={"access_token": token}, data=data, timeout=120)
+    resp = SESSION.post(url, params={"access_token": token}, data=data, timeout=120)
     payload = _json_or_text(resp)
 
     if not resp.ok:
@@ -94,9 +214,9 @@ def create_post_with_attached_media_full(
     data: Dict[str, str] = {"message": message}
 
     for i, mid in enumerate(media_ids):
-        data[f"attached_media[{i}]"] = json.dumps({"media_fbid": mid})
+        data[f"attached_media[{i}]"] = _media_fbid_json(mid)
 
-    resp = requests.post(url, params={"access_token": token}, data=data, timeout=120)
+    resp = SESSION.post(url, params={"access_token": token}, data=data, timeout=120)
     payload = _json_or_text(resp)
 
     if not resp.ok:
@@ -114,7 +234,7 @@ def update_post_text(post_id: str, token: str, message: str) -> Dict[str, Any]:
     Returns full Meta payload (so you can log it).
     """
     url = _graph(post_id)
-    resp = requests.post(
+    resp = _post_with_backoff(
         url,
         params={"access_token": token},
         data={"message": message},
@@ -128,12 +248,98 @@ def update_post_text(post_id: str, token: str, message: str) -> Dict[str, Any]:
     return payload
 
 
+FB_BATCH_MAX = 50  # limite Graph: 50 opérations par requête batch
+
+
+def _graph_batch(ops: List[Dict[str, Any]], token: str) -> List[Tuple[Any, Optional[str]]]:
+    """
+    Exécute des opérations Graph via ?batch= (FB_BATCH_MAX ops par POST).
+    Les ops throttlées individuellement (429/5xx, codes 4/17/32/613) sont
+    re-batchées après backoff, jusqu'à FB_MAX_RETRIES fois.
+    Retourne (body décodé, None) ou (None, erreur) par op, dans le même ordre.
+    """
+    out: List[Tuple[Any, Optional[str]]] = [(None, "FB batch: no response for op")] * len(ops)
+    pending = list(range(len(ops)))
+    attempt = 0
+    while pending:
+        throttled: List[int] = []
+        for i in range(0, len(pending), FB_BATCH_MAX):
+            idxs = pending[i:i + FB_BATCH_MAX]
+            chunk = [ops[j] for j in idxs]
+            try:
+                resp = _post_with_backoff(
+                    _graph(""),
+                    data={"access_token": token, "batch": json_dumps_bytes(chunk).decode("utf-8"), "include_headers": "false"},
+                    timeout=120,
+                )
+                payload = _json_or_text(resp) if resp.ok else None
+                if not isinstance(payload, list):
+                    raise RuntimeError(f"FB batch failed {resp.status_code}: {_json_or_text(resp)}")
+            except Exception as e:
+                for j in idxs:
+                    out[j] = (None, str(e))
+                continue
+
+            for j, res in zip(idxs, payload + [None] * (len(chunk) - len(payload))):
+                # None = op non exécutée (timeout côté Graph)
+                if not isinstance(res, dict):
+                    out[j] = (None, "FB batch: no response for op")
+                    continue
+                code = int(res.get("code") or 0)
+                body = res.get("body")
+                try:
+                    body = json_loads(body) if isinstance(body, str) else body
+                except Exception:
+                    pass
+                if code != 200:
+                    out[j] = (None, f"FB batch op failed {code}: {res.get('body')}")
+                    err = body.get("error") if isinstance(body, dict) else None
+                    if code == 429 or code >= 500 or (isinstance(err, dict) and err.get("code") in _THROTTLE_CODES):
+                        throttled.append(j)
+                    continue
+                out[j] = (body, None)
+
+        if not throttled or attempt >= FB_MAX_RETRIES:
+            break
+        time.sleep(min(FB_MAX_BACKOFF, (2 ** attempt) + random.uniform(0, 1)))
+        attempt += 1
+        pending = throttled
+
+    return out
+
+
+def update_posts_text_batch(items: List[Tuple[str, str]], token: str) -> List[Optional[str]]:
+    """
+    Update du message de plusieurs posts via Graph ?batch= (50 ops par POST).
+    items: [(post_id, message), ...]
+    Retourne une erreur (str) ou None par item, dans le même ordre.
+    """
+    ops = [
+        {"method": "POST", "relative_url": post_id, "body": urlencode({"message": message})}
+        for post_id, message in items
+    ]
+    return [err for _, err in _graph_batch(ops, token)]
+
+
+def fetch_posts_messages_batch(post_ids: List[str], token: str) -> Dict[str, str]:
+    """
+    Message actuel de plusieurs posts via Graph ?batch= (50 GET par POST).
+    Retourne {post_id: message} pour les posts lus avec succès seulement.
+    """
+    ops = [{"method": "GET", "relative_url": f"{pid}?fields=message"} for pid in post_ids]
+    out: Dict[str, str] = {}
+    for pid, (body, err) in zip(post_ids, _graph_batch(ops, token)):
+        if err is None and isinstance(body, dict):
+            out[pid] = body.get("message") or ""
+    return out
+
+
 def comment_on_post(post_id: str, token: str, message: str) -> str:
     """
     Create a comment on a post. Returns comment_id (string).
     """
     url = _graph(f"{post_id}/comments")
-    resp = requests.post(url, params={"access_token": token}, data={"message": message}, timeout=60)
+    resp = SESSION.post(url, params={"access_token": token}, data={"message": message}, timeout=60)
     payload = _json_or_text(resp)
 
     if not resp.ok:
@@ -151,7 +357,7 @@ def comment_photo(post_id: str, token: str, attachment_id: str, message: str = "
     if message:
         data["message"] = message
 
-    resp = requests.post(url, params={"access_token": token}, data=data, timeout=60)
+    resp = SESSION.post(url, params={"access_token": token}, data=data, timeout=60)
     payload = _json_or_text(resp)
 
     if not resp.ok:
@@ -173,26 +379,10 @@ def publish_photos_as_comment_batch(page_id: str, token: str, post_id: str, phot
     except Exception:
         pass
 
-    # Upload en unpublished, puis attache chaque photo au post via commentaire
-    for p in photo_paths:
-        url = _graph(f"{page_id}/photos")
-        with open(p, "rb") as f:
-            resp = requests.post(
-                url,
-                params={"access_token": token},
-                data={"published": "false"},
-                files={"source": f},
-                timeout=120,
-            )
-
-        payload = _json_or_text(resp)
-        if not resp.ok:
-            raise RuntimeError(f"FB upload extra photo failed {resp.status_code}: {payload}")
-
-        mid = payload.get("id")
-        if not mid:
-            raise RuntimeError(f"FB upload extra photo missing id: {payload}")
-
+    # Upload en unpublished (en parallèle), puis attache chaque photo au post
+    # via commentaire, dans l'ordre
+    media_ids = _upload_unpublished_photos(page_id, token, photo_paths, what="extra photo")
+    for mid in media_ids:
         # Attache la photo comme commentaire (PAS un post)
         comment_photo(post_id, token, attachment_id=mid)
 
@@ -202,7 +392,7 @@ def fetch_fb_post_message(post_id: str, token: str) -> str:
     Fetch current post message (proof after update).
     """
     url = _graph(post_id)
-    resp = requests.get(
+    resp = SESSION.get(
         url,
         params={"access_token": token, "fields": "message"},
         timeout=30,
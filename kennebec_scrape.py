@@ -1,7 +1,7 @@
 import re
 import requests
-from bs4 import BeautifulSoup
-from typing import Any, Dict, List, Set, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Any, Dict, List, Set, Optional, Tuple
 from urllib.parse import urljoin, urlsplit, urlunsplit
 
 def _clean_price_int(s: str) -> Optional[int]:
@@ -28,6 +28,10 @@ def _clean_km_int(s: str) -> Optional[int]:
     except Exception:
         return None
 
+# On ne construit que les balises utiles (arbre beaucoup plus petit)
+_LISTING_STRAINER = SoupStrainer("a", href=True)
+_DETAIL_STRAINER = SoupStrainer(["h1", "img"])
+
 def slugify(title: str, stock: str) -> str:
     base = (title or "").lower()
     base = re.sub(r"[^a-z0-9]+", "-", base)
@@ -40,30 +44,52 @@ def fetch_html(session: requests.Session, url: str, timeout: int = 30) -> str:
     r.raise_for_status()
     return r.text
 
-def parse_inventory_listing_urls(base_url: str, inventory_path: str, html: str) -> List[str]:
-    soup = BeautifulSoup(html, "html.parser")
-    out: Set[str] = set()
+def _listing_detail_url(base_url: str, inventory_path: str, u: str) -> Optional[str]:
+    if not u:
+        return None
+    full = u if u.startswith("http") else urljoin(base_url, u)
+    parts = urlsplit(full)
+    path = parts.path or ""
+    if not path.startswith(inventory_path):
+        return None
+    if not re.search(r"-id\d+$", path.rstrip("/"), re.IGNORECASE):
+        return None
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
 
-    def add(u: str) -> None:
-        if not u:
-            return
-        full = u if u.startswith("http") else urljoin(base_url, u)
-        parts = urlsplit(full)
-        path = parts.path or ""
-        if not path.startswith(inventory_path):
-            return
-        if not re.search(r"-id\d+$", path.rstrip("/"), re.IGNORECASE):
-            return
-        clean = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
-        out.add(clean)
+def parse_inventory_listing(base_url: str, inventory_path: str, html: str) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Un seul parse de la page listing -> (URLs de fiches triées, prix listing par URL).
+    Prix best-effort: seuls les liens dont le texte contient un prix ("33 995 $") comptent;
+    une URL avec des prix contradictoires est ignorée.
+    """
+    soup = BeautifulSoup(html, "html.parser", parse_only=_LISTING_STRAINER)
+    out: Set[str] = set()
+    prices: Dict[str, int] = {}
+    conflicts: Set[str] = set()
 
     for a in soup.find_all("a", href=True):
-        add(a.get("href") or "")
+        clean = _listing_detail_url(base_url, inventory_path, a.get("href") or "")
+        if not clean:
+            continue
+        out.add(clean)
+        price = _clean_price_int(a.get_text(" ", strip=True))
+        if price is None:
+            continue
+        if prices.get(clean, price) != price:
+            conflicts.add(clean)
+        prices[clean] = price
 
     for m in re.findall(r'(/fr/inventaire-occasion/[^\s"\'<>]+?-id\d+)', html, flags=re.IGNORECASE):
-        add(m)
+        clean = _listing_detail_url(base_url, inventory_path, m)
+        if clean:
+            out.add(clean)
+
+    for u in conflicts:
+        prices.pop(u, None)
+    return sorted(out), prices
 
-    return sorted(out)
+def parse_inventory_listing_urls(base_url: str, inventory_path: str, html: str) -> List[str]:
+    return parse_inventory_listing(base_url, inventory_path, html)[0]
 
 def parse_vehicle_detail_simple(session: requests.Session, url: str) -> Dict[str, Any]:
     """
@@ -71,7 +97,7 @@ def parse_vehicle_detail_simple(session: requests.Session, url: str) -> Dict[str
     Plus tard on remplacera par vehicleDetails (brace matching) version KenBot.
     """
     html = fetch_html(session, url)
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "html.parser", parse_only=_DETAIL_STRAINER)
 
     h1 = soup.find("h1")
     title = (h1.get_text(" ", strip=True) if h1 else "").strip() or "Sans titre"
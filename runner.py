@@ -2,17 +2,25 @@ import os
 import re
 import json
 import time
-import hashlib
 import csv
 import io
+import tempfile
+import shutil
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 from kennebec_scrape import (
-    parse_inventory_listing_urls,
+    parse_inventory_listing,
     parse_vehicle_detail_simple,
     slugify,
 )
@@ -33,7 +41,8 @@ from supabase_db import (
     get_posts_map,
     upsert_inventory,
     upsert_post,
-    log_event,
+    upsert_posts,
+    BufferedEventLog,
     utc_now_iso,
 
     # storage + snapshots
@@ -42,12 +51,16 @@ from supabase_db import (
     upload_json_to_storage,
     upload_bytes_to_storage,
     cleanup_storage_runs,
+    list_storage_names,
 
     # mémoire tables
     upsert_scrape_run,
     upsert_raw_page,
     upsert_sticker_pdf,
     upsert_output,
+
+    # json
+    json_loads,
 )
 
 # -------------------------
@@ -84,11 +97,35 @@ DRY_RUN = os.getenv("KENBOT_DRY_RUN", "0").strip() == "1"
 REBUILD_POSTS = os.getenv("KENBOT_REBUILD_POSTS", "0").strip() == "1"
 FORCE_STOCK = (os.getenv("KENBOT_FORCE_STOCK") or "").strip().upper()
 
+BUILD_ALL_OUTPUTS = os.getenv("KENBOT_BUILD_ALL_OUTPUTS", "0").strip() == "1"
+PUBLISH_MISSING = os.getenv("KENBOT_PUBLISH_MISSING", "0").strip() == "1"
+BUILD_META_FEEDS = os.getenv("KENBOT_BUILD_META_FEEDS", "0").strip() == "1"
+
+# Réutilise la ligne DB (sans fetch détail) si le prix listing == prix DB
+SKIP_UNCHANGED_DETAILS = os.getenv("KENBOT_SKIP_UNCHANGED_DETAILS", "1").strip() == "1"
+# ... seulement si la fiche a été lue il y a moins de N heures (inventory.last_seen =
+# dernier fetch détail: pas rafraîchi sur une ligne réutilisée)
+DETAIL_MAX_AGE_H = int(os.getenv("KENBOT_DETAIL_MAX_AGE_H", "24").strip() or "24")
+
 MAX_TARGETS = int(os.getenv("KENBOT_MAX_TARGETS", "4").strip() or "4")
 SLEEP_BETWEEN = int(os.getenv("KENBOT_SLEEP_BETWEEN_POSTS", "30").strip() or "30")
+# Actions FB autorisées d'affilée avant d'appliquer SLEEP_BETWEEN (token bucket)
+FB_BURST = int(os.getenv("KENBOT_FB_BURST", "1").strip() or "1")
+DETAIL_WORKERS = int(os.getenv("KENBOT_DETAIL_WORKERS", "8").strip() or "8")
+PHOTO_WORKERS = int(os.getenv("KENBOT_PHOTO_WORKERS", "8").strip() or "8")
+HOST_CONCURRENCY = int(os.getenv("KENBOT_HOST_CONCURRENCY", "6").strip() or "6")
+PREP_WORKERS = int(os.getenv("KENBOT_PREP_WORKERS", "2").strip() or "2")
+# Publications FB en vol simultanément (le token bucket espace toujours les départs)
+FB_WORKERS = int(os.getenv("KENBOT_FB_WORKERS", "2").strip() or "2")
+# Upserts posts regroupés: flush tous les N targets publiés (et en fin de run)
+POSTS_BATCH = int(os.getenv("KENBOT_POSTS_BATCH", "25").strip() or "25")
+EVENTS_BATCH = int(os.getenv("KENBOT_EVENTS_BATCH", "256").strip() or "256")
+# 0 = events bruts (debug), 1 = doublons exacts fusionnés avec un compteur
+EVENTS_DEDUPE = os.getenv("KENBOT_EVENTS_DEDUPE", "1").strip() == "1"
 
 CACHE_STICKERS = os.getenv("KENBOT_CACHE_STICKERS", "1").strip() == "1"
 STICKER_MAX = int(os.getenv("KENBOT_STICKER_MAX", "999").strip() or "999")
+STICKER_WORKERS = int(os.getenv("KENBOT_STICKER_WORKERS", "8").strip() or "8")
 
 RAW_KEEP = int(os.getenv("KENBOT_RAW_KEEP", "2").strip() or "2")
 SNAP_KEEP = int(os.getenv("KENBOT_SNAP_KEEP", "10").strip() or "10")
@@ -96,8 +133,23 @@ SNAP_KEEP = int(os.getenv("KENBOT_SNAP_KEEP", "10").strip() or "10")
 MAX_PHOTOS = int(os.getenv("KENBOT_MAX_PHOTOS", "15").strip() or "15")
 POST_PHOTOS = int(os.getenv("KENBOT_POST_PHOTOS", "10").strip() or "10")
 
-TMP_PHOTOS = Path(os.getenv("KENBOT_TMP_PHOTOS_DIR", "/tmp/kenbot_photos"))
+# Pool HTTP (keep-alive) partagé par toutes les requêtes du runner
+HTTP_POOL_SIZE = int(os.getenv("KENBOT_HTTP_POOL_SIZE", "32").strip() or "32")
+
+# Photos transitoires: tmpfs (/dev/shm) si dispo et assez grand, sinon /tmp.
+# (Docker limite souvent /dev/shm à 64 Mo -> seuil minimum d'espace libre)
+def _default_tmp_root() -> Path:
+    shm = Path("/dev/shm")
+    try:
+        if shm.is_dir() and os.access(shm, os.W_OK) and shutil.disk_usage(shm).free >= 512 * 1024 * 1024:
+            return shm
+    except OSError:
+        pass
+    return Path("/tmp")
+
+TMP_PHOTOS = Path(os.getenv("KENBOT_TMP_PHOTOS_DIR") or str(_default_tmp_root() / "kenbot_photos"))
 TMP_PHOTOS.mkdir(parents=True, exist_ok=True)
+_MKDIR_CACHE: set[Path] = {TMP_PHOTOS}
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise SystemExit("🛑 Supabase creds manquants: SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY")
@@ -107,6 +159,14 @@ if not TEXT_ENGINE_URL:
     raise SystemExit("🛑 KENBOT_TEXT_ENGINE_URL manquant (kenbot-text-engine)")
 
 SESSION = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=HTTP_POOL_SIZE,
+    pool_maxsize=HTTP_POOL_SIZE,
+    # Retries idempotents (GET) sur erreurs transitoires; la réponse finale est rendue telle quelle
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504), raise_on_status=False),
+)
+SESSION.mount("https://", _HTTP_ADAPTER)
+SESSION.mount("http://", _HTTP_ADAPTER)
 SESSION.headers.update({
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Safari/605.1.15",
     "Accept-Language": "fr-CA,fr;q=0.9,en;q=0.8",
@@ -115,17 +175,17 @@ SESSION.headers.update({
 # -------------------------
 # Helpers
 # -------------------------
-def _sha256_hex(b: bytes) -> str:
-    return hashlib.sha256(b or b"").hexdigest()
+# Séparateurs ISO-8601 retirés d'un coup (str.translate, boucle C)
+_ISO_SEPARATORS = str.maketrans("", "", "-:T.Z+ ")
 
 def _run_id_from_now(now_iso: str) -> str:
-    digits = "".join(ch for ch in (now_iso or "") if ch.isdigit())
-    if len(digits) >= 14:
+    digits = (now_iso or "").translate(_ISO_SEPARATORS)
+    if len(digits) >= 14 and digits[:14].isdigit():
         return f"{digits[0:8]}_{digits[8:14]}"
     return f"run_{int(time.time())}"
 
 def _is_pdf_ok(b: bytes) -> bool:
-    return bool(b) and len(b) >= 10_240 and b[:4] == b"%PDF"
+    return len(b or b"") >= 10_240 and b[:4] == b"%PDF"
 
 def _is_stellantis_vin(vin: str) -> bool:
     vin = (vin or "").strip().upper()
@@ -142,15 +202,28 @@ def _clean_title(t: str) -> str:
         return ""
     return t
 
+_CLEAN_INT_TABLE = str.maketrans("", "", " \u00a0,$")
+
 def _clean_int(x) -> Optional[int]:
     if x is None:
         return None
     try:
-        s = str(x).replace(" ", "").replace("\u00a0", "").replace(",", "").replace("$", "")
-        return int(s)
+        return int(str(x).translate(_CLEAN_INT_TABLE))
     except Exception:
         return None
 
+# Regex pré-compilées (boucles par post / par véhicule)
+_POST_STOCK_RE = re.compile(r"\b(\d{5}[A-Za-z]?)\b")
+_YEAR_RE = re.compile(r"\b(19\d{2}|20\d{2})\b")
+_YEAR_TOKEN_RE = re.compile(r"(19|20)\d{2}")
+_WS_RE = re.compile(r"\s+")
+
+# Photos promo/bannières à exclure (un seul passage regex par URL)
+_BAD_PHOTO_KW_RE = re.compile(
+    r"cr[eé]dit|bail|commercial|inspect|garantie|warranty|financ|promo|banner|banni[eè]re",
+    re.IGNORECASE,
+)
+
 def _dealer_footer() -> str:
     return (
         "\n"
@@ -164,6 +237,8 @@ def _dealer_footer() -> str:
         "[[DG_FOOTER]]"
     )
 
+DEALER_FOOTER = _dealer_footer()
+
 FOOTER_MARKERS = [
     "j’accepte", "j'accepte",
     "échange", "echange",
@@ -174,6 +249,7 @@ FOOTER_MARKERS = [
     "en privé", "en prive",
     "#danielgiroux",
 ]
+_FOOTER_MARKERS_RE = re.compile("|".join(re.escape(m) for m in FOOTER_MARKERS))
 
 def ensure_single_footer(text: str, footer: str) -> str:
     """
@@ -189,7 +265,7 @@ def ensure_single_footer(text: str, footer: str) -> str:
         return base
 
     # Filet de sécurité (DGText peut déjà avoir un CTA)
-    if any(m in low for m in FOOTER_MARKERS):
+    if _FOOTER_MARKERS_RE.search(low):
         return base
 
     return f"{base}\n\n{footer}".strip()
@@ -198,6 +274,59 @@ def _has_hashtags(txt: str) -> bool:
     t = (txt or "")
     return "#" in t
 
+# Tables de hashtags (construites une fois au chargement, pas à chaque texte)
+_BASE_TAGS = (
+    "#KennebecDodge", "#StGeorges", "#Beauce",
+    "#AutoUsagée", "#Occasion", "#VéhiculeDoccasion",
+    "#FinancementAuto", "#TradeIn", "#LivraisonRapide",
+)
+
+# Signaux / catégories: (mots-clés, tags)
+_SIGNAL_TAGS = (
+    (("4x4", "awd", "4wd", "quatre roues motrices"), ("#4x4", "#AWD", "#HiverQC")),
+    (("camion", "truck", "pickup", "boite", "remorquage", "towing"), ("#Camion", "#Pickup", "#TruckLife")),
+    (("vus", "suv", "cuv"), ("#SUV", "#VUS")),
+    (("hybride", "hybrid"), ("#Hybride", "#ÉconomieEssence")),
+    (("électrique", "electric", "ev"), ("#Électrique", "#EV")),
+)
+
+# Marques populaires (stable)
+_BRAND_TAGS = {
+    "ram": ("#RAM", "#RamTruck"),
+    "jeep": ("#Jeep", "#JeepLife"),
+    "dodge": ("#Dodge",),
+    "chrysler": ("#Chrysler",),
+    "toyota": ("#Toyota",),
+    "honda": ("#Honda",),
+    "ford": ("#Ford",),
+    "chevrolet": ("#Chevrolet",),
+    "gmc": ("#GMC",),
+    "mazda": ("#Mazda",),
+    "subaru": ("#Subaru",),
+    "hyundai": ("#Hyundai",),
+    "kia": ("#Kia",),
+    "nissan": ("#Nissan",),
+    "bmw": ("#BMW",),
+    "mercedes": ("#Mercedes",),
+    "audi": ("#Audi",),
+    "volkswagen": ("#Volkswagen",),
+}
+
+# Modèles "aimants" (stables, très recherchés côté occasion)
+_MODEL_TAGS = {
+    "wrangler": ("#Wrangler", "#JeepWrangler"),
+    "grand cherokee": ("#GrandCherokee",),
+    "cherokee": ("#Cherokee",),
+    "compass": ("#JeepCompass",),
+    "gladiator": ("#JeepGladiator",),
+    "ram 1500": ("#Ram1500",),
+    "ram 2500": ("#Ram2500",),
+    "promaster": ("#ProMaster",),
+    "charger": ("#DodgeCharger",),
+    "challenger": ("#DodgeChallenger",),
+    "pacifica": ("#ChryslerPacifica",),
+}
+
 def smart_hashtags(make: str = "", model: str = "", title: str = "", body: str = "") -> str:
     """
     Hashtags "intelligents" basés sur marque/modèle + signaux (4x4, camion, VUS, hybride, EV).
@@ -207,93 +336,37 @@ def smart_hashtags(make: str = "", model: str = "", title: str = "", body: str =
     md = (model or "").strip().lower()
     t = f"{title} {body}".lower()
 
-    tags = [
-        "#KennebecDodge", "#StGeorges", "#Beauce",
-        "#AutoUsagée", "#Occasion", "#VéhiculeDoccasion",
-        "#FinancementAuto", "#TradeIn", "#LivraisonRapide",
-    ]
+    tags = list(_BASE_TAGS)
 
-    # Signaux / catégories
-    if any(x in t for x in ["4x4", "awd", "4wd", "quatre roues motrices"]):
-        tags += ["#4x4", "#AWD", "#HiverQC"]
-    if any(x in t for x in ["camion", "truck", "pickup", "boite", "remorquage", "towing"]):
-        tags += ["#Camion", "#Pickup", "#TruckLife"]
-    if any(x in t for x in ["vus", "suv", "cuv"]):
-        tags += ["#SUV", "#VUS"]
-    if any(x in t for x in ["hybride", "hybrid"]):
-        tags += ["#Hybride", "#ÉconomieEssence"]
-    if any(x in t for x in ["électrique", "electric", "ev"]):
-        tags += ["#Électrique", "#EV"]
-
-    # Marques populaires (stable)
-    brand_map = {
-        "ram": ["#RAM", "#RamTruck"],
-        "jeep": ["#Jeep", "#JeepLife"],
-        "dodge": ["#Dodge"],
-        "chrysler": ["#Chrysler"],
-        "toyota": ["#Toyota"],
-        "honda": ["#Honda"],
-        "ford": ["#Ford"],
-        "chevrolet": ["#Chevrolet"],
-        "gmc": ["#GMC"],
-        "mazda": ["#Mazda"],
-        "subaru": ["#Subaru"],
-        "hyundai": ["#Hyundai"],
-        "kia": ["#Kia"],
-        "nissan": ["#Nissan"],
-        "bmw": ["#BMW"],
-        "mercedes": ["#Mercedes"],
-        "audi": ["#Audi"],
-        "volkswagen": ["#Volkswagen"],
-    }
-    for key, extra in brand_map.items():
-        if key and key in mk:
+    for keywords, extra in _SIGNAL_TAGS:
+        if any(x in t for x in keywords):
             tags += extra
-            break
 
-    # Modèles "aimants" (stables, très recherchés côté occasion)
-    model_map = {
-        "wrangler": ["#Wrangler", "#JeepWrangler"],
-        "grand cherokee": ["#GrandCherokee"],
-        "cherokee": ["#Cherokee"],
-        "compass": ["#JeepCompass"],
-        "gladiator": ["#JeepGladiator"],
-        "ram 1500": ["#Ram1500"],
-        "ram 2500": ["#Ram2500"],
-        "promaster": ["#ProMaster"],
-        "charger": ["#DodgeCharger"],
-        "challenger": ["#DodgeChallenger"],
-        "pacifica": ["#ChryslerPacifica"],
-    }
+    for key, extra in _BRAND_TAGS.items():
+        if key in mk:
+            tags += extra
+            break
 
     full = f"{md} {t}"
-    for k, extra in model_map.items():
+    for k, extra in _MODEL_TAGS.items():
         if k in full:
             tags += extra
 
-    # Dedupe + limite
-    out, seen = [], set()
-    for tag in tags:
-        if tag not in seen:
-            out.append(tag)
-            seen.add(tag)
+    # Dedupe (ordre conservé) + limite
+    return " ".join(list(dict.fromkeys(tags))[:18])
 
-    return " ".join(out[:18])
+# Bannière VENDU = tout jusqu'à la fin de la ligne séparateur incluse
+_SOLD_BANNER_RE = re.compile(r"\A🚨 VENDU 🚨.*?────────────────────", re.S)
 
 def _strip_sold_banner(txt: str) -> str:
     t = (txt or "").lstrip()
     if not t.startswith("🚨 VENDU 🚨"):
         return t
-    lines = t.splitlines()
-    out = []
-    cutting = True
-    for line in lines:
-        if cutting:
-            if "────────────────────" in line:
-                cutting = False
-            continue
-        out.append(line)
-    return ("\n".join(out)).lstrip()
+    m = _SOLD_BANNER_RE.match(t)
+    if not m:
+        return ""
+    # splitlines() comme avant: reste de la ligne séparateur coupé, \r\n normalisés, pas de \n final
+    return "\n".join(t[m.end():].splitlines()[1:]).lstrip()
 
 def _sold_prefix() -> str:
     return (
@@ -306,31 +379,83 @@ def _sold_prefix() -> str:
         "────────────────────\n\n"
     )
 
+SOLD_PREFIX = _sold_prefix()
+
 def _make_sold_message(base_text: str) -> str:
     base = _strip_sold_banner(base_text).strip()
     if not base:
         base = "(Détails indisponibles — contactez-moi.)"
-    return _sold_prefix() + base
+    return SOLD_PREFIX + base
 
 def _fetch_fb_post_message(post_id: str) -> str:
     url = f"https://graph.facebook.com/v24.0/{post_id}"
     r = SESSION.get(url, params={"fields": "message", "access_token": FB_TOKEN}, timeout=30)
-    j = r.json()
+    j = json_loads(r.content)
     if not r.ok:
         raise RuntimeError(f"FB get post message error: {j}")
     return (j.get("message") or "").strip()
 
+def _fetch_listing_page(url: str) -> Tuple[bytes, str, Optional[Exception]]:
+    """
+    Retourne (bytes UTF-8 pour Storage, html décodé, erreur).
+    Décodé une seule fois; les bytes bruts sont réutilisés tels quels s'ils sont déjà en UTF-8.
+    """
+    try:
+        r = SESSION.get(url, timeout=30)
+        data = r.content or b""
+        encoding = r.encoding or r.apparent_encoding or "utf-8"
+        html = data.decode(encoding, errors="replace")
+        if encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            data = html.encode("utf-8")
+        return data, html, None
+    except Exception as e:
+        return b"", "", e
+
+def _fetch_vehicle_detail(url: str) -> Tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+    try:
+        return parse_vehicle_detail_simple(SESSION, url), None
+    except Exception as e:
+        return None, e
+
+# Concurrence bornée PAR HÔTE: un hôte lent (ex: chrysler.com) ne bloque pas le CDN photos
+_HOST_SEMS: Dict[str, threading.BoundedSemaphore] = {}
+_HOST_SEMS_LOCK = threading.Lock()
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url or "").netloc.lower()
+    with _HOST_SEMS_LOCK:
+        sem = _HOST_SEMS.get(host)
+        if sem is None:
+            sem = _HOST_SEMS[host] = threading.BoundedSemaphore(max(1, HOST_CONCURRENCY))
+        return sem
+
 def _download_photo(url: str, out_path: Path) -> None:
-    r = SESSION.get(url, timeout=60)
+    with _host_slot(url):
+        r = SESSION.get(url, timeout=60)
     r.raise_for_status()
     out_path.write_bytes(r.content)
 
+def _download_photo_safe(job: Tuple[str, Path]) -> Optional[Path]:
+    url, out_path = job
+    try:
+        _download_photo(url, out_path)
+        return out_path
+    except Exception:
+        return None
+
 def _download_photos(stock: str, urls: List[str], limit: int) -> List[Path]:
-    out: List[Path] = []
     stock = (stock or "UNKNOWN").strip().upper()
     folder = TMP_PHOTOS / stock
-    folder.mkdir(parents=True, exist_ok=True)
+    if folder not in _MKDIR_CACHE:
+        folder.mkdir(parents=True, exist_ok=True)
+        _MKDIR_CACHE.add(folder)
 
+    # Un seul listing du dossier au lieu d'un stat() par photo
+    with os.scandir(folder) as it:
+        existing = {e.name for e in it}
+
+    paths: List[Path] = []
+    jobs: List[Tuple[str, Path]] = []
     for i, u in enumerate(urls[:limit], start=1):
         ext = ".jpg"
         low = (u or "").lower()
@@ -339,13 +464,18 @@ def _download_photos(stock: str, urls: List[str], limit: int) -> List[Path]:
         elif ".webp" in low:
             ext = ".webp"
         p = folder / f"{stock}_{i:02d}{ext}"
-        if not p.exists():
-            try:
-                _download_photo(u, p)
-            except Exception:
-                continue
-        out.append(p)
-    return out
+        paths.append(p)
+        if p.name not in existing:
+            jobs.append((u, p))
+
+    # Téléchargements en parallèle; l'ordre des photos est conservé
+    failed: set[Path] = set()
+    if jobs:
+        with ThreadPoolExecutor(max_workers=max(1, PHOTO_WORKERS)) as pool:
+            for (_, p), res in zip(jobs, pool.map(_download_photo_safe, jobs)):
+                if res is None:
+                    failed.add(p)
+    return [p for p in paths if p not in failed]
 
 def rebuild_posts_map(limit: int = 300) -> Dict[str, Dict[str, Any]]:
     posts_map: Dict[str, Dict[str, Any]] = {}
@@ -353,13 +483,16 @@ def rebuild_posts_map(limit: int = 300) -> Dict[str, Dict[str, Any]]:
     after = None
 
     while fetched < limit:
-        params = {"fields": "id,message,created_time,permalink_url", "limit": 25, "access_token": FB_TOKEN}
+        # Pages de 100 (max Graph) plutôt que 25: 4x moins d'allers-retours.
+        # permalink_url n'est pas utilisé -> pas demandé.
+        page_size = max(1, min(100, limit - fetched))
+        params = {"fields": "id,message,created_time", "limit": page_size, "access_token": FB_TOKEN}
         if after:
             params["after"] = after
 
         url = f"https://graph.facebook.com/v24.0/{FB_PAGE_ID}/posts"
         r = SESSION.get(url, params=params, timeout=60)
-        j = r.json()
+        j = json_loads(r.content)
         if not r.ok:
             raise RuntimeError(f"FB posts fetch failed: {j}")
 
@@ -375,7 +508,7 @@ def rebuild_posts_map(limit: int = 300) -> Dict[str, Dict[str, Any]]:
             if not post_id or not msg:
                 continue
 
-            m = re.search(r"\b(\d{5}[A-Za-z]?)\b", msg)
+            m = _POST_STOCK_RE.search(msg)
             stock = (m.group(1).upper() if m else "")
             if not stock:
                 continue
@@ -391,7 +524,28 @@ def rebuild_posts_map(limit: int = 300) -> Dict[str, Dict[str, Any]]:
 
     return posts_map
 
-def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
+def _list_sticker_vins(sb, folder: str) -> Optional[set[str]]:
+    """
+    VINs présents dans STICKERS_BUCKET/<folder> (un seul listing).
+    None si le listing échoue (=> ensure_sticker_cached retombe sur les probes download).
+    """
+    try:
+        names = list_storage_names(sb, STICKERS_BUCKET, folder)
+    except Exception:
+        return None
+    return {n[:-4].upper() for n in names if n.lower().endswith(".pdf")}
+
+def ensure_sticker_cached(
+    sb,
+    vin: str,
+    run_id: str,
+    ok_vins: Optional[set[str]] = None,
+    bad_vins: Optional[set[str]] = None,
+) -> Dict[str, Any]:
+    """
+    ok_vins / bad_vins: listings pré-chargés de pdf_ok / pdf_bad.
+    Quand fournis, on ne télécharge que les PDFs qui existent vraiment.
+    """
     vin = (vin or "").strip().upper()
     if len(vin) != 17:
         return {"vin": vin, "status": "skip", "reason": "vin_invalid"}
@@ -400,20 +554,24 @@ def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
     bad_path = f"pdf_bad/{vin}.pdf"
 
     # Try existing OK
-    try:
-        blob = sb.storage.from_(STICKERS_BUCKET).download(ok_path)
-    except Exception:
-        blob = None
+    blob = None
+    if ok_vins is None or vin in ok_vins:
+        try:
+            blob = sb.storage.from_(STICKERS_BUCKET).download(ok_path)
+        except Exception:
+            blob = None
 
     if _is_pdf_ok(blob or b""):
         upsert_sticker_pdf(sb, vin=vin, status="ok", storage_path=ok_path, data=blob, reason="", run_id=run_id)
         return {"vin": vin, "status": "ok"}
 
     # Try existing BAD
-    try:
-        blob_bad = sb.storage.from_(STICKERS_BUCKET).download(bad_path)
-    except Exception:
-        blob_bad = None
+    blob_bad = None
+    if bad_vins is None or vin in bad_vins:
+        try:
+            blob_bad = sb.storage.from_(STICKERS_BUCKET).download(bad_path)
+        except Exception:
+            blob_bad = None
 
     if blob_bad is not None and len(blob_bad) > 0:
         upsert_sticker_pdf(sb, vin=vin, status="bad", storage_path=bad_path, data=blob_bad, reason="cached_bad", run_id=run_id)
@@ -422,7 +580,8 @@ def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
     # Fetch from Stellantis
     pdf_url = f"https://www.chrysler.com/hostd/windowsticker/getWindowStickerPdf.do?vin={vin}"
     try:
-        r = SESSION.get(pdf_url, timeout=25)
+        with _host_slot(pdf_url):
+            r = SESSION.get(pdf_url, timeout=25)
         fetched = r.content or b""
     except Exception:
         fetched = b""
@@ -450,7 +609,7 @@ def build_meta_vehicle_feed_csv(current: dict) -> bytes:
     - description = infos utiles sans recopier le title
     """
     def _extract_year(title: str) -> str:
-        m = re.search(r"\b(19\d{2}|20\d{2})\b", title or "")
+        m = _YEAR_RE.search(title or "")
         return m.group(1) if m else ""
 
     def _extract_brand_model(title: str) -> tuple[str, str]:
@@ -467,7 +626,7 @@ def build_meta_vehicle_feed_csv(current: dict) -> bytes:
         # Trouver l'année si elle existe
         year_idx = None
         for i, p in enumerate(parts):
-            if re.fullmatch(r"(19|20)\d{2}", p):
+            if _YEAR_TOKEN_RE.fullmatch(p):
                 year_idx = i
                 break
 
@@ -481,7 +640,7 @@ def build_meta_vehicle_feed_csv(current: dict) -> bytes:
 
         # Nettoyage
         brand = (brand or "").strip()
-        model = re.sub(r"\s+", " ", (model or "")).strip()
+        model = _WS_RE.sub(" ", (model or "")).strip()
 
         # Meta n'aime pas les romans en model
         if len(model) > 80:
@@ -539,8 +698,8 @@ def build_meta_vehicle_feed_csv(current: dict) -> bytes:
     ]
 
     buf = io.StringIO()
-    w = csv.DictWriter(buf, fieldnames=fieldnames)
-    w.writeheader()
+    w = csv.writer(buf)
+    w.writerow(fieldnames)
 
     for slug, v in (current or {}).items():
         stock = (v.get("stock") or "").strip().upper()
@@ -550,9 +709,7 @@ def build_meta_vehicle_feed_csv(current: dict) -> bytes:
 
         # fallback si price_int absent
         if not isinstance(price_int, int):
-            p = (v.get("price") or "").strip()
-            digits = "".join(ch for ch in p if ch.isdigit())
-            price_int = int(digits) if digits else None
+            price_int = _clean_int(v.get("price"))
 
         photos = v.get("photos") or []
         image_link = (photos[0] or "").strip() if photos else ""
@@ -590,87 +747,362 @@ def build_meta_vehicle_feed_csv(current: dict) -> bytes:
             desc_parts.append(body_style)
         description = " • ".join(desc_parts)[:5000]
 
-        w.writerow({
-            "id": stock,
-            "title": clean_title,
-            "description": description,
-            "availability": "in stock",
-            "condition": "used",
-            "price": f"{price_int} CAD",
-            "link": url,
-            "image_link": image_link,
-            "brand": brand,
-            "year": year,
-            "model": model,
-            "mileage": mileage,
-            "body_style": body_style,
-        })
+        # Même ordre que fieldnames
+        w.writerow([
+            stock,
+            clean_title,
+            description,
+            "in stock",
+            "used",
+            f"{price_int} CAD",
+            url,
+            image_link,
+            brand,
+            year,
+            model,
+            mileage,
+            body_style,
+        ])
 
     return buf.getvalue().encode("utf-8")
 
+# Colonnes posts utilisées par main() (targets, SOLD, PUBLISH_MISSING, REBUILD)
+POSTS_COLUMNS = "slug,post_id,status,base_text,stock"
+
+# -------------------------
+# Targets (préparation / publication)
+# -------------------------
+class _TokenBucket:
+    """
+    Token bucket pour les actions FB: `rate` jetons/seconde, au plus `capacity`
+    en réserve. acquire() ne dort que si le seau est vide, et seulement le temps
+    de regagner un jeton (le temps passé sur un appel FB lent compte déjà).
+    """
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = max(0.0, float(rate))
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        # Lock tenu pendant l'attente: les workers FB passent un par un.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1.0:
+                time.sleep((1.0 - self._tokens) / self.rate)
+                self._last = time.monotonic()
+                self._tokens = 1.0
+            self._tokens -= 1.0
+
+def _prepare_target(
+    sb,
+    events: BufferedEventLog,
+    run_id: str,
+    slug: str,
+    event: str,
+    v: Dict[str, Any],
+    post: Dict[str, Any],
+    pdf_ok_vins: set[str],
+) -> Optional[Dict[str, Any]]:
+    """
+    Tout ce qui ne touche pas Facebook: texte, outputs Storage, photos.
+    `post` = ligne posts existante ({} si aucune).
+    Retourne None si le target est ignoré.
+    """
+    post_id = post.get("post_id")
+    # `v` vient de `current`: stock/vin/title/price_int/km_int déjà normalisés
+    stock = v.get("stock") or ""
+    vin = v.get("vin") or ""
+    title = v.get("title") or ""
+    if not stock or not title:
+        events.log(slug, "SKIP_BAD_DATA", {"reason": "missing_stock_or_title", "run_id": run_id})
+        return None
+
+    price_int = v.get("price_int")
+    km_int = v.get("km_int")
+
+    vehicle_payload = {
+        "title": title,
+        "price": (f"{price_int:,}".replace(",", " ") + " $") if price_int else "",
+        "mileage": (f"{km_int:,}".replace(",", " ") + " km") if km_int else "",
+        "stock": stock,
+        "vin": vin,
+        "url": v.get("url") or "",
+    }
+
+    fb_text = ensure_single_footer(
+        generate_facebook_text(TEXT_ENGINE_URL, slug=slug, event=event, vehicle=vehicle_payload),
+        DEALER_FOOTER,
+    )
+
+    # Hashtags: si DGText en a déjà, on ne touche pas.
+    if not _has_hashtags(fb_text):
+        fb_text = (fb_text.rstrip() + "\n\n" + smart_hashtags(
+            v.get("make", ""), v.get("model", ""), title=title, body=fb_text
+        )).strip()
+
+    # with/without = pdf_ok (source of truth)
+    out_folder = "with" if (vin and vin in pdf_ok_vins) else "without"
+    fb_out_path = f"{out_folder}/{stock}_facebook.txt"
+    mp_out_path = f"{out_folder}/{stock}_marketplace.txt"
+
+    upload_bytes_to_storage(
+        sb, OUTPUTS_BUCKET, fb_out_path, (fb_text + "\n").encode("utf-8"),
+        content_type="text/plain; charset=utf-8", upsert=True
+    )
+    upload_bytes_to_storage(
+        sb, OUTPUTS_BUCKET, mp_out_path, (fb_text + "\n").encode("utf-8"),
+        content_type="text/plain; charset=utf-8", upsert=True
+    )
+    upsert_output(sb, stock=stock, kind="text", facebook_path=fb_out_path, marketplace_path=mp_out_path, run_id=run_id)
+
+    photo_urls = [u for u in (v.get("photos") or []) if u and not _BAD_PHOTO_KW_RE.search(u)]
+    photo_paths = _download_photos(stock, photo_urls, limit=MAX_PHOTOS)
+
+    ALLOW_NO_PHOTO = os.getenv("KENBOT_ALLOW_NO_PHOTO", "0").strip() == "1"
+    NO_PHOTO_BUCKET = (os.getenv("KENBOT_NO_PHOTO_BUCKET") or OUTPUTS_BUCKET).strip()
+    NO_PHOTO_PATH = (os.getenv("KENBOT_NO_PHOTO_PATH") or "assets/no_photo.png").strip()
+
+    if not photo_paths:
+        events.log(slug, "NO_PHOTOS", {"stock": stock, "url": v.get("url"), "run_id": run_id})
+
+        if not ALLOW_NO_PHOTO:
+            print(f"SKIP {stock}: no photos (set KENBOT_ALLOW_NO_PHOTO=1)", flush=True)
+            return None
+
+        try:
+            blob = sb.storage.from_(NO_PHOTO_BUCKET).download(NO_PHOTO_PATH)
+        except Exception as e:
+            print(
+                f"SKIP {stock}: cannot download placeholder {NO_PHOTO_BUCKET}/{NO_PHOTO_PATH} -> {e}",
+                flush=True,
+            )
+            return None
+
+        # Un fichier par stock (dossier photos du stock, créé par _download_photos), écrit
+        # via temp + rename: les préparations parallèles et un upload FB en cours sur un
+        # autre target ne lisent jamais un placeholder tronqué.
+        tmp_placeholder = TMP_PHOTOS / stock / f"{stock}_no_photo.png"
+        with tempfile.NamedTemporaryFile(dir=tmp_placeholder.parent, suffix=".tmp", delete=False) as f:
+            f.write(blob)
+        os.replace(f.name, tmp_placeholder)
+
+        photo_paths = [tmp_placeholder]
+        # fb_text = "📷 Photos suivront bientôt.\n\n" + fb_text
+
+    return {
+        "slug": slug,
+        "event": event,
+        "stock": stock,
+        "post_id": post_id,
+        "fb_text": fb_text,
+        "photo_paths": photo_paths,
+        # état FB connu (pour sauter les updates identiques)
+        "prev_text": post.get("base_text") or "",
+        "prev_stock": (post.get("stock") or "").strip().upper(),
+        "prev_status": str(post.get("status") or "").upper(),
+    }
+
+def _flush_posts(sb, pending_posts: List[Dict[str, Any]], events: BufferedEventLog) -> None:
+    """
+    Écrit les lignes posts en attente puis les events du même lot:
+    un succès FB = 2 requêtes par paquet (posts + events), jamais par target.
+    """
+    # Les workers FB peuvent ajouter pendant le flush: on ne retire que ce qu'on envoie.
+    batch = pending_posts[:]
+    if batch:
+        del pending_posts[:len(batch)]
+        upsert_posts(sb, batch)
+        events.flush()
+
+def _post_protos(now: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parties constantes (pour tout le run) des lignes posts publiées.
+    Construites une fois dans main(); chaque target n'ajoute que ses champs.
+    """
+    return {
+        "NEW": {"status": "ACTIVE", "published_at": now, "last_updated_at": now},
+        "UPDATE": {"status": "ACTIVE", "last_updated_at": now},
+    }
+
+def _publish_target(
+    events: BufferedEventLog,
+    run_id: str,
+    post_protos: Dict[str, Dict[str, Any]],
+    prep: Dict[str, Any],
+    limiter: _TokenBucket,
+) -> Optional[Dict[str, Any]]:
+    """
+    Publie / met à jour sur FB (appelé depuis les workers FB).
+    Retourne la ligne posts à upserter (bulk via _flush_posts), ou None.
+    """
+    slug = prep["slug"]
+    event = prep["event"]
+    stock = prep["stock"]
+    post_id = prep["post_id"]
+    fb_text = prep["fb_text"]
+    photo_paths = prep["photo_paths"]
+
+    if DRY_RUN:
+        print(f"\n=== DRY_RUN {event}: {slug} ({stock}) ===\n{fb_text[:900]}\n")
+        events.log(slug, event, {"dry_run": True, "photos": len(photo_paths), "post_id": post_id, "run_id": run_id})
+        return None
+
+    if event == "PRICE_CHANGED" and not post_id:
+        events.log(slug, "PRICE_CHANGED_SKIP_NO_POST_ID", {"run_id": run_id})
+        return None
+
+    # Texte identique à celui déjà publié: ni appel FB ni écriture posts
+    # (FORCE_PREVIEW republie quand même, c'est voulu)
+    if (
+        post_id
+        and event != "FORCE_PREVIEW"
+        and prep["prev_status"] == "ACTIVE"
+        and prep["prev_stock"] == stock
+        and prep["prev_text"] == fb_text
+    ):
+        events.log(slug, "FB_SKIP_UNCHANGED", {"post_id": post_id, "event": event, "run_id": run_id})
+        return None
+
+    limiter.acquire()
+
+    if not post_id:
+        main_photos = photo_paths[:POST_PHOTOS]
+        extra_photos = photo_paths[POST_PHOTOS:MAX_PHOTOS]
+        try:
+            media_ids = publish_photos_unpublished(FB_PAGE_ID, FB_TOKEN, main_photos, limit=POST_PHOTOS)
+            post_id = create_post_with_attached_media(FB_PAGE_ID, FB_TOKEN, fb_text, media_ids)
+            if extra_photos:
+                publish_photos_as_comment_batch(FB_PAGE_ID, FB_TOKEN, post_id, extra_photos)
+
+            events.log(slug, "FB_NEW_OK", {"post_id": post_id, "photos": len(photo_paths), "run_id": run_id})
+            return post_protos["NEW"] | {"slug": slug, "post_id": post_id, "base_text": fb_text, "stock": stock}
+        except Exception as e:
+            events.log(slug, "FB_NEW_FAIL", {"err": str(e), "run_id": run_id})
+    else:
+        try:
+            update_post_text(post_id, FB_TOKEN, fb_text)
+            events.log(slug, "FB_UPDATE_OK", {"post_id": post_id, "event": event, "run_id": run_id})
+            return post_protos["UPDATE"] | {"slug": slug, "post_id": post_id, "base_text": fb_text, "stock": stock}
+        except Exception as e:
+            events.log(slug, "FB_UPDATE_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
+    return None
+
 # -------------------------
 # Main
 # -------------------------
 def main() -> None:
     sb = get_client(SUPABASE_URL, SUPABASE_KEY)
+    # Events bufferisés (insert bulk); atexit couvre les sorties anticipées
+    events = BufferedEventLog(sb, cap=EVENTS_BATCH, dedupe=EVENTS_DEDUPE)
+    atexit.register(events.flush)
     now = utc_now_iso()
     run_id = _run_id_from_now(now)
 
+    # REBUILD (Graph FB) lancé en arrière-plan dès le départ: il chevauche les lectures
+    # Supabase et le fetch des pages listing (autre origine, indépendant).
+    fb_map_fut = None
+    if REBUILD_POSTS:
+        rebuild_pool = ThreadPoolExecutor(max_workers=1)
+        fb_map_fut = rebuild_pool.submit(rebuild_posts_map, 300)
+        rebuild_pool.shutdown(wait=False)  # la tâche soumise continue
+
     inv_db = get_inventory_map(sb)
-    posts_db = get_posts_map(sb)
+    # Une seule lecture bulk de posts, limitée aux colonnes lues par le runner
+    posts_db = get_posts_map(sb, columns=POSTS_COLUMNS)
+
+    # Fetch 3 listing pages (RAW)
+    pages = [
+        f"{BASE_URL}{INVENTORY_PATH}",
+        f"{BASE_URL}{INVENTORY_PATH}?page=2",
+        f"{BASE_URL}{INVENTORY_PATH}?page=3",
+    ]
+
+    all_urls: List[str] = []
+    listing_prices: Dict[str, int] = {}
+
+    with ThreadPoolExecutor(max_workers=len(pages)) as pool:
+        page_results = list(pool.map(_fetch_listing_page, pages))
+
+    # Une passe par page: parse + upload RAW, puis la page est libérée
+    for idx, page_url in enumerate(pages, start=1):
+        data, html, err = page_results[idx - 1]
+        page_results[idx - 1] = None
+        if err is not None:
+            events.log("SCRAPE", "PAGE_FETCH_FAIL", {"page": page_url, "err": str(err), "run_id": run_id})
+
+        if html:
+            try:
+                urls, prices = parse_inventory_listing(BASE_URL, INVENTORY_PATH, html)
+                all_urls += urls
+                listing_prices.update(prices)
+            except Exception as e:
+                events.log("SCRAPE", "PARSE_LISTING_FAIL", {"page": page_url, "err": str(e), "run_id": run_id})
+
+        # Upload RAW page + DB raw_pages
+        storage_path = f"raw_pages/{run_id}/kennebec_page_{idx}.html"
+        upload_bytes_to_storage(sb, RAW_BUCKET, storage_path, data, content_type="text/html; charset=utf-8", upsert=True)
+        try:
+            upsert_raw_page(sb, run_id, idx, storage_path, data)
+        except Exception as e:
+            events.log("RAW", "RAW_PAGE_DB_FAIL", {"page_no": idx, "err": str(e), "run_id": run_id})
+        del data, html
+
+    all_urls = sorted(list(dict.fromkeys(all_urls)))
 
     # Optional rebuild FB posts
     fb_map: Dict[str, Dict[str, Any]] = {}
-    if REBUILD_POSTS:
-        fb_map = rebuild_posts_map(limit=300)
+    if fb_map_fut is not None:
+        fb_map = fb_map_fut.result()
         upload_json_to_storage(sb, SNAP_BUCKET, f"runs/{run_id}/fb_map_by_stock.json", fb_map, upsert=True)
 
+        # stock -> slug de la ligne posts en mémoire (construit une fois, tenu à jour)
+        post_slug_by_stock: Dict[str, str] = {}
+        for s_slug, p in posts_db.items():
+            st = (p.get("stock") or "").strip().upper()
+            if st:
+                post_slug_by_stock[st] = s_slug
+
         updated = 0
         for slug, inv in inv_db.items():
             stock = (inv.get("stock") or "").strip().upper()
             info = fb_map.get(stock) if stock else None
             if not info:
                 continue
-            upsert_post(sb, {
+            row = {
                 "slug": slug,
                 "post_id": info.get("post_id"),
                 "status": "ACTIVE",
                 "published_at": info.get("published_at"),
                 "last_updated_at": now,
                 "stock": stock,
-            })
+            }
+            upsert_post(sb, row)
             updated += 1
 
-        log_event(sb, "REBUILD", "REBUILD_POSTS_OK", {"fb_found": len(fb_map), "updated": updated, "run_id": run_id})
-        posts_db = get_posts_map(sb)
-
-    # Fetch 3 listing pages (RAW)
-    pages = [
-        f"{BASE_URL}{INVENTORY_PATH}",
-        f"{BASE_URL}{INVENTORY_PATH}?page=2",
-        f"{BASE_URL}{INVENTORY_PATH}?page=3",
-    ]
-
-    pages_html: List[Tuple[int, str]] = []
-    all_urls: List[str] = []
-
-    for idx, page_url in enumerate(pages, start=1):
-        try:
-            html = SESSION.get(page_url, timeout=30).text
-        except Exception as e:
-            html = ""
-            log_event(sb, "SCRAPE", "PAGE_FETCH_FAIL", {"page": page_url, "err": str(e), "run_id": run_id})
-
-        pages_html.append((idx, html))
-        if html:
-            try:
-                all_urls += parse_inventory_listing_urls(BASE_URL, INVENTORY_PATH, html)
-            except Exception as e:
-                log_event(sb, "SCRAPE", "PARSE_LISTING_FAIL", {"page": page_url, "err": str(e), "run_id": run_id})
+            # Reflète l'upsert en mémoire (évite de relire toute la table posts).
+            # upsert_post résout sur stock: la ligne existante de ce stock est mise à jour
+            # (renommée en `slug`), ses autres colonnes (base_text, ...) sont conservées.
+            prev_stock = ((posts_db.get(slug) or {}).get("stock") or "").strip().upper()
+            if prev_stock and prev_stock != stock and post_slug_by_stock.get(prev_stock) == slug:
+                del post_slug_by_stock[prev_stock]
+            other_slug = post_slug_by_stock.get(stock)
+            if other_slug is not None and other_slug != slug:
+                base = posts_db.pop(other_slug, None) or {}
+            elif prev_stock and prev_stock != stock:
+                base = {}  # ligne d'un autre véhicule: l'upsert en crée une nouvelle
+            else:
+                base = posts_db.get(slug) or {}
+            posts_db[slug] = {**base, **row}
+            post_slug_by_stock[stock] = slug
 
-    all_urls = sorted(list(dict.fromkeys(all_urls)))
+        events.log("REBUILD", "REBUILD_POSTS_OK", {"fb_found": len(fb_map), "updated": updated, "run_id": run_id})
 
-    # Upload RAW pages + DB raw_pages
     meta = {
         "run_id": run_id,
         "ts": now,
@@ -682,54 +1114,96 @@ def main() -> None:
     }
     upload_json_to_storage(sb, RAW_BUCKET, f"raw_pages/{run_id}/meta.json", meta, upsert=True)
 
-    for page_no, html in pages_html:
-        data = (html or "").encode("utf-8")
-        storage_path = f"raw_pages/{run_id}/kennebec_page_{page_no}.html"
-        upload_bytes_to_storage(sb, RAW_BUCKET, storage_path, data, content_type="text/html; charset=utf-8", upsert=True)
-        try:
-            upsert_raw_page(sb, run_id, page_no, storage_path, data)
-        except Exception as e:
-            log_event(sb, "RAW", "RAW_PAGE_DB_FAIL", {"page_no": page_no, "err": str(e), "run_id": run_id})
-
     try:
         deleted = cleanup_storage_runs(sb, RAW_BUCKET, "raw_pages", keep=RAW_KEEP)
-        log_event(sb, "RAW", "RAW_CLEANUP", {"keep": RAW_KEEP, "deleted": deleted, "run_id": run_id})
+        events.log("RAW", "RAW_CLEANUP", {"keep": RAW_KEEP, "deleted": deleted, "run_id": run_id})
     except Exception as e:
-        log_event(sb, "RAW", "RAW_CLEANUP_FAIL", {"err": str(e), "run_id": run_id})
+        events.log("RAW", "RAW_CLEANUP_FAIL", {"err": str(e), "run_id": run_id})
+
+    # Fiches déjà connues au même prix: pas de fetch détail.
+    # Désactivé quand un mode a besoin des photos fraîches de tout l'inventaire.
+    inv_by_url: Dict[str, Dict[str, Any]] = {}
+    if SKIP_UNCHANGED_DETAILS and not (FORCE_STOCK or BUILD_ALL_OUTPUTS or PUBLISH_MISSING or BUILD_META_FEEDS):
+        for r in inv_db.values():
+            if (r.get("status") or "").upper() == "ACTIVE" and r.get("url"):
+                inv_by_url[r["url"]] = r
+
+    def _detail_fresh(r: Dict[str, Any]) -> bool:
+        try:
+            seen = datetime.fromisoformat(str(r.get("last_seen") or "").replace("Z", "+00:00"))
+        except ValueError:
+            return False
+        if seen.tzinfo is None:
+            seen = seen.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - seen).total_seconds() < DETAIL_MAX_AGE_H * 3600
+
+    # Réutilisée seulement si: même prix, VIN connu (sinon sticker jamais caché) et fiche récente
+    reused: Dict[str, Dict[str, Any]] = {}
+    for url in all_urls:
+        known = inv_by_url.get(url)
+        if (
+            known
+            and known.get("price_int") is not None
+            and known.get("price_int") == listing_prices.get(url)
+            and (known.get("vin") or "").strip()
+            and _detail_fresh(known)
+        ):
+            reused[url] = {
+                "url": url,
+                "title": known.get("title"),
+                "stock": known.get("stock"),
+                "vin": known.get("vin"),
+                "price_int": known.get("price_int"),
+                "km_int": known.get("km_int"),
+                "photos": [],
+            }
+    details_reused = len(reused)
+
+    # Fetch détails en parallèle (I/O bound), parse dans l'ordre des URLs
+    to_fetch = [u for u in all_urls if u not in reused]
+    with ThreadPoolExecutor(max_workers=max(1, DETAIL_WORKERS)) as pool:
+        fetched = dict(zip(to_fetch, pool.map(_fetch_vehicle_detail, to_fetch)))
 
     # Parse inventory vehicles
     current: Dict[str, Dict[str, Any]] = {}
     for url in all_urls:
-        try:
-            d = parse_vehicle_detail_simple(SESSION, url)
-        except Exception as e:
-            log_event(sb, "SCRAPE", "DETAIL_FAIL", {"url": url, "err": str(e), "run_id": run_id})
-            continue
+        d = reused.get(url)
+        if d is None:
+            d, err = fetched[url]
+            if err is not None:
+                events.log("SCRAPE", "DETAIL_FAIL", {"url": url, "err": str(err), "run_id": run_id})
+                continue
 
+        # Normalise une seule fois; les lignes invalides sont ignorées
         stock = (d.get("stock") or "").strip().upper()
+        if not stock:
+            continue
         title = _clean_title(d.get("title") or "")
-        if not stock or not title:
+        if not title:
             continue
 
-        d["title"] = title
-        d["stock"] = stock
-        d["url"] = d.get("url") or url
-        d["vin"] = (d.get("vin") or "").strip().upper()
-        d["price_int"] = _clean_int(d.get("price_int"))
-        d["km_int"] = _clean_int(d.get("km_int"))
-
         slug = slugify(title, stock)
-        d["slug"] = slug
+        d.update(
+            slug=slug,
+            title=title,
+            stock=stock,
+            url=d.get("url") or url,
+            vin=(d.get("vin") or "").strip().upper(),
+            price_int=_clean_int(d.get("price_int")),
+            km_int=_clean_int(d.get("km_int")),
+        )
         current[slug] = d
 
     inv_count = len(current)
     upsert_scrape_run(sb, run_id, status="OK", note=f"inv_count={inv_count} urls={len(all_urls)}")
 
     meta["inventory_count"] = inv_count
+    meta["details_reused"] = details_reused
     upload_json_to_storage(sb, RAW_BUCKET, f"raw_pages/{run_id}/meta.json", meta, upsert=True)
 
     # Cache stickers for ALL inventory
     vin_status: Dict[str, str] = {}
+    ok_vins: Optional[set[str]] = None
     if CACHE_STICKERS:
         vins = []
         for v in current.values():
@@ -738,10 +1212,18 @@ def main() -> None:
                 vins.append(vin)
         vins = list(dict.fromkeys(vins))[:max(0, STICKER_MAX)]
 
+        # 2 listings au lieu de 2 probes download par VIN
+        ok_vins = _list_sticker_vins(sb, "pdf_ok")
+        bad_vins = _list_sticker_vins(sb, "pdf_bad")
+
+        # Storage + Stellantis en parallèle (borné pour ne pas marteler chrysler.com)
+        with ThreadPoolExecutor(max_workers=max(1, STICKER_WORKERS)) as pool:
+            futures = {vin: pool.submit(ensure_sticker_cached, sb, vin, run_id, ok_vins, bad_vins) for vin in vins}
+
         ok = bad = skip = 0
-        for vin in vins:
+        for vin, fut in futures.items():
             try:
-                res = ensure_sticker_cached(sb, vin, run_id)
+                res = fut.result()
                 st = (res.get("status") or "").lower()
                 vin_status[vin] = st
                 if st == "ok":
@@ -751,14 +1233,16 @@ def main() -> None:
                 else:
                     skip += 1
             except Exception as e:
-                log_event(sb, "STICKER", "STICKER_FAIL", {"vin": vin, "err": str(e), "run_id": run_id})
+                events.log("STICKER", "STICKER_FAIL", {"vin": vin, "err": str(e), "run_id": run_id})
 
-        log_event(sb, "STICKER", "STICKER_SUMMARY", {"ok": ok, "bad": bad, "skip": skip, "total": len(vins), "run_id": run_id})
+        events.log("STICKER", "STICKER_SUMMARY", {"ok": ok, "bad": bad, "skip": skip, "total": len(vins), "run_id": run_id})
 
-    # Upsert inventory ACTIVE
+    # Upsert inventory ACTIVE. last_seen = date du dernier fetch détail: non touché
+    # pour les fiches réutilisées, qui vieillissent donc jusqu'au prochain vrai fetch.
+    reused_urls = reused.keys()
     rows = []
     for slug, v in current.items():
-        rows.append({
+        row = {
             "slug": slug,
             "stock": v.get("stock"),
             "url": v.get("url"),
@@ -767,21 +1251,27 @@ def main() -> None:
             "price_int": v.get("price_int"),
             "km_int": v.get("km_int"),
             "status": "ACTIVE",
-            "last_seen": now,
             "updated_at": now,
-        })
+        }
+        if v.get("url") not in reused_urls:
+            row["last_seen"] = now
+        rows.append(row)
     upsert_inventory(sb, rows)
 
     # SOLD detection
-    current_slugs = set(current.keys())
+    # Vues de clés: les opérations d'ensemble se font sans copie
+    current_slugs = current.keys()
     inv_db_active = {slug: r for slug, r in inv_db.items() if (r.get("status") or "").upper() == "ACTIVE"}
-    db_slugs = set(inv_db_active.keys())
+    db_slugs = inv_db_active.keys()
 
-    disappeared_slugs = sorted(db_slugs - current_slugs)
+    # Ordre sans importance pour SOLD / comparaison de prix: sets bruts.
+    # Seules les listes qui deviennent des targets (limitées par MAX_TARGETS) sont triées.
+    disappeared_slugs = db_slugs - current_slugs
     new_slugs = sorted(current_slugs - db_slugs)
-    common_slugs = sorted(current_slugs & db_slugs)
+    common_slugs = current_slugs & db_slugs
 
-    # SOLD flow
+    # SOLD flow (inventory SOLD en un seul upsert à la fin)
+    sold_rows: List[Dict[str, Any]] = []
     for slug in disappeared_slugs:
         post = posts_db.get(slug) or {}
         post_id = post.get("post_id")
@@ -808,12 +1298,12 @@ def main() -> None:
                         "base_text": base_text,
                         "stock": post.get("stock"),
                     })
-                    log_event(sb, slug, "SOLD", {"post_id": post_id, "run_id": run_id})
+                    events.log(slug, "SOLD", {"post_id": post_id, "run_id": run_id})
                 except Exception as e:
-                    log_event(sb, slug, "FB_SOLD_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
+                    events.log(slug, "FB_SOLD_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
 
         old_inv = inv_db.get(slug) or {}
-        upsert_inventory(sb, [{
+        sold_rows.append({
             "slug": slug,
             "stock": old_inv.get("stock"),
             "url": old_inv.get("url"),
@@ -824,7 +1314,8 @@ def main() -> None:
             "status": "SOLD",
             "last_seen": old_inv.get("last_seen") or now,
             "updated_at": now,
-        }])
+        })
+    upsert_inventory(sb, sold_rows)
 
     # PRICE_CHANGED
     price_changed: List[str] = []
@@ -834,7 +1325,7 @@ def main() -> None:
         if old.get("price_int") is not None and new.get("price_int") is not None and old.get("price_int") != new.get("price_int"):
             price_changed.append(slug)
 
-    if os.getenv("KENBOT_BUILD_META_FEEDS", "0").strip() == "1":
+    if BUILD_META_FEEDS:
         feed_bytes = build_meta_vehicle_feed_csv(current)
         upload_bytes_to_storage(
             sb,
@@ -860,11 +1351,8 @@ def main() -> None:
         if latest_run:
             fb_map = read_json_from_storage(sb, SNAP_BUCKET, f"runs/{latest_run}/fb_map_by_stock.json") or {}
 
-    current_by_stock: Dict[str, str] = {}
-    for s_slug, v in current.items():
-        st = (v.get("stock") or "").strip().upper()
-        if st:
-            current_by_stock[st] = s_slug
+    # stock déjà normalisé à la construction de `current`
+    current_by_stock: Dict[str, str] = {v["stock"]: s_slug for s_slug, v in current.items()}
 
     index_by_stock: Dict[str, Any] = {}
     for stock, info in (fb_map or {}).items():
@@ -886,31 +1374,27 @@ def main() -> None:
         pass
 
     # Targets
+    price_changed.sort()
     targets: List[Tuple[str, str]] = [(s, "PRICE_CHANGED") for s in price_changed] + [(s, "NEW") for s in new_slugs]
 
-    # Flags
-    BUILD_ALL_OUTPUTS = os.getenv("KENBOT_BUILD_ALL_OUTPUTS", "0").strip() == "1"
-    PUBLISH_MISSING = os.getenv("KENBOT_PUBLISH_MISSING", "0").strip() == "1"
-
-    # Build pdf_ok_vins from storage (source of truth)
+    # Build pdf_ok_vins (source of truth = storage pdf_ok)
+    # Réutilise le listing + les résultats de la passe stickers quand c'est le même bucket.
     STICKER_BUCKET = os.getenv("KENBOT_STICKER_BUCKET", "kennebec-stickers").strip()
     pdf_ok_vins: set[str] = set()
-    try:
-        for o in (sb.storage.from_(STICKER_BUCKET).list("pdf_ok") or []):
-            name = (o.get("name") or "")
-            if name.lower().endswith(".pdf"):
-                pdf_ok_vins.add(name[:-4].upper())  # strip .pdf
+    if ok_vins is not None and STICKER_BUCKET == STICKERS_BUCKET:
+        pdf_ok_vins = ok_vins | {vin for vin, st in vin_status.items() if st == "ok"}
         print(f"STICKERS pdf_ok_vins={len(pdf_ok_vins)}", flush=True)
-    except Exception as e:
-        print(f"⚠️ Cannot list {STICKER_BUCKET}/pdf_ok: {e}", flush=True)
+    else:
+        try:
+            names = list_storage_names(sb, STICKER_BUCKET, "pdf_ok")
+            pdf_ok_vins = {n[:-4].upper() for n in names if n.lower().endswith(".pdf")}  # strip .pdf
+            print(f"STICKERS pdf_ok_vins={len(pdf_ok_vins)}", flush=True)
+        except Exception as e:
+            print(f"⚠️ Cannot list {STICKER_BUCKET}/pdf_ok: {e}", flush=True)
 
     # FORCE_STOCK (priorité #1)
     if FORCE_STOCK:
-        forced_slug = None
-        for s_slug, v_info in current.items():
-            if (v_info.get("stock") or "").strip().upper() == FORCE_STOCK:
-                forced_slug = s_slug
-                break
+        forced_slug = current_by_stock.get(FORCE_STOCK)
         targets = [(forced_slug, "FORCE_PREVIEW")] if forced_slug else []
 
     # BUILD_ALL_OUTPUTS (priorité #2)
@@ -932,138 +1416,57 @@ def main() -> None:
     if not FORCE_STOCK and MAX_TARGETS > 0 and not BUILD_ALL_OUTPUTS:
         targets = targets[:MAX_TARGETS]
 
-    # Process targets
-    for slug, event in targets:
-        v = current.get(slug) or {}
-        stock = (v.get("stock") or "").strip().upper()
-        vin = (v.get("vin") or "").strip().upper()
-        title = _clean_title(v.get("title") or "")
-        if not stock or not title:
-            log_event(sb, slug, "SKIP_BAD_DATA", {"reason": "missing_stock_or_title", "run_id": run_id})
-            continue
-
-        price_int = _clean_int(v.get("price_int"))
-        km_int = _clean_int(v.get("km_int"))
+    # Process targets: la préparation (texte, outputs, photos) tourne en arrière-plan;
+    # les publications FB partent dès qu'un target est prêt, au plus FB_WORKERS
+    # à la fois, espacées par le token bucket. Les écritures Supabase (posts + events)
+    # partent sur un writer dédié (1 thread = ordre conservé) pour ne pas bloquer la boucle.
+    limiter = _TokenBucket(rate=(1.0 / SLEEP_BETWEEN) if SLEEP_BETWEEN > 0 else 0.0, capacity=FB_BURST)
+    post_protos = _post_protos(now)
+    pending_posts: List[Dict[str, Any]] = []
 
-        vehicle_payload = {
-            "title": title,
-            "price": (f"{price_int:,}".replace(",", " ") + " $") if price_int else "",
-            "mileage": (f"{km_int:,}".replace(",", " ") + " km") if km_int else "",
-            "stock": stock,
-            "vin": vin,
-            "url": v.get("url") or "",
-        }
+    def _collect(fut) -> None:
+        # Callback (thread du worker FB): la ligne est gardée même si le run plante ensuite
+        if not fut.cancelled() and fut.exception() is None and fut.result():
+            pending_posts.append(fut.result())
 
-        fb_text = ensure_single_footer(
-            generate_facebook_text(TEXT_ENGINE_URL, slug=slug, event=event, vehicle=vehicle_payload),
-            _dealer_footer(),
-        )
-    
-        # Hashtags: si DGText en a déjà, on ne touche pas.
-        if not _has_hashtags(fb_text):
-            fb_text = (fb_text.rstrip() + "\n\n" + smart_hashtags(
-                v.get("make", ""), v.get("model", ""), title=title, body=fb_text
-            )).strip()
-
-        # with/without = pdf_ok (source of truth)
-        out_folder = "with" if (vin and vin in pdf_ok_vins) else "without"
-        fb_out_path = f"{out_folder}/{stock}_facebook.txt"
-        mp_out_path = f"{out_folder}/{stock}_marketplace.txt"
-
-        upload_bytes_to_storage(
-            sb, OUTPUTS_BUCKET, fb_out_path, (fb_text + "\n").encode("utf-8"),
-            content_type="text/plain; charset=utf-8", upsert=True
-        )
-        upload_bytes_to_storage(
-            sb, OUTPUTS_BUCKET, mp_out_path, (fb_text + "\n").encode("utf-8"),
-            content_type="text/plain; charset=utf-8", upsert=True
-        )
-        upsert_output(sb, stock=stock, kind="text", facebook_path=fb_out_path, marketplace_path=mp_out_path, run_id=run_id)
-
-        post_info = posts_db.get(slug) or {}
-        post_id = post_info.get("post_id")
-
-        photo_urls = v.get("photos") or []
-        bad_kw = ("credit", "crédit", "bail", "commercial", "inspect", "inspection", "garantie",
-                  "warranty", "finance", "financement", "promo", "promotion", "banner", "banniere", "bannière")
-        photo_urls = [u for u in photo_urls if u and not any(k in u.lower() for k in bad_kw)]
-        photo_paths = _download_photos(stock, photo_urls, limit=MAX_PHOTOS)
-
-        ALLOW_NO_PHOTO = os.getenv("KENBOT_ALLOW_NO_PHOTO", "0").strip() == "1"
-        NO_PHOTO_BUCKET = (os.getenv("KENBOT_NO_PHOTO_BUCKET") or OUTPUTS_BUCKET).strip()
-        NO_PHOTO_PATH = (os.getenv("KENBOT_NO_PHOTO_PATH") or "assets/no_photo.png").strip()
-
-        if not photo_paths:
-            log_event(sb, slug, "NO_PHOTOS", {"stock": stock, "url": v.get("url"), "run_id": run_id})
-
-            if not ALLOW_NO_PHOTO:
-                print(f"SKIP {stock}: no photos (set KENBOT_ALLOW_NO_PHOTO=1)", flush=True)
-                continue
-
-            try:
-                blob = sb.storage.from_(NO_PHOTO_BUCKET).download(NO_PHOTO_PATH)
-            except Exception as e:
-                print(
-                    f"SKIP {stock}: cannot download placeholder {NO_PHOTO_BUCKET}/{NO_PHOTO_PATH} -> {e}",
-                    flush=True,
-                )
-                continue
-
-            tmp_placeholder = Path("/tmp") / "kenbot_no_photo.png"
-            tmp_placeholder.write_bytes(blob)
-
-            photo_paths = [tmp_placeholder]
-            # fb_text = "📷 Photos suivront bientôt.\n\n" + fb_text
-    
-        if DRY_RUN:
-            print(f"\n=== DRY_RUN {event}: {slug} ({stock}) ===\n{fb_text[:900]}\n")
-            log_event(sb, slug, event, {"dry_run": True, "photos": len(photo_paths), "post_id": post_id, "run_id": run_id})
-            continue
-
-        if event == "PRICE_CHANGED" and not post_id:
-            log_event(sb, slug, "PRICE_CHANGED_SKIP_NO_POST_ID", {"run_id": run_id})
-            continue
-
-        if not post_id:
-            main_photos = photo_paths[:POST_PHOTOS]
-            extra_photos = photo_paths[POST_PHOTOS:MAX_PHOTOS]
-            try:
-                media_ids = publish_photos_unpublished(FB_PAGE_ID, FB_TOKEN, main_photos, limit=POST_PHOTOS)
-                post_id = create_post_with_attached_media(FB_PAGE_ID, FB_TOKEN, fb_text, media_ids)
-                if extra_photos:
-                    publish_photos_as_comment_batch(FB_PAGE_ID, FB_TOKEN, post_id, extra_photos)
-
-                upsert_post(sb, {
-                    "slug": slug,
-                    "post_id": post_id,
-                    "status": "ACTIVE",
-                    "published_at": now,
-                    "last_updated_at": now,
-                    "base_text": fb_text,
-                    "stock": stock,
-                })
-                log_event(sb, slug, "FB_NEW_OK", {"post_id": post_id, "photos": len(photo_paths), "run_id": run_id})
-            except Exception as e:
-                log_event(sb, slug, "FB_NEW_FAIL", {"err": str(e), "run_id": run_id})
-        else:
-            try:
-                update_post_text(post_id, FB_TOKEN, fb_text)
-                upsert_post(sb, {
-                    "slug": slug,
-                    "post_id": post_id,
-                    "status": "ACTIVE",
-                    "last_updated_at": now,
-                    "base_text": fb_text,
-                    "stock": stock,
-                })
-                log_event(sb, slug, "FB_UPDATE_OK", {"post_id": post_id, "event": event, "run_id": run_id})
-            except Exception as e:
-                log_event(sb, slug, "FB_UPDATE_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
-
-        if SLEEP_BETWEEN > 0:
-            time.sleep(SLEEP_BETWEEN)
-
-    print(f"OK run_id={run_id} inv_count={inv_count} NEW={len(new_slugs)} SOLD={len(disappeared_slugs)} PRICE_CHANGED={len(price_changed)}")
+    try:
+        with ThreadPoolExecutor(max_workers=1) as writer, \
+                ThreadPoolExecutor(max_workers=max(1, PREP_WORKERS)) as pool, \
+                ThreadPoolExecutor(max_workers=max(1, FB_WORKERS)) as fb_pool:
+            prep_futures = [
+                pool.submit(_prepare_target, sb, events, run_id, slug, event, current.get(slug) or {},
+                            posts_db.get(slug) or {}, pdf_ok_vins)
+                for slug, event in targets
+            ]
+            publish_futures = []
+            for fut in prep_futures:
+                prep = fut.result()
+                if prep:
+                    pub = fb_pool.submit(_publish_target, events, run_id, post_protos, prep, limiter)
+                    pub.add_done_callback(_collect)
+                    publish_futures.append(pub)
+                if len(pending_posts) >= max(1, POSTS_BATCH):
+                    writer.submit(_flush_posts, sb, pending_posts, events)
+            for fut in publish_futures:
+                fut.result()
+                if len(pending_posts) >= max(1, POSTS_BATCH):
+                    writer.submit(_flush_posts, sb, pending_posts, events)
+    finally:
+        # Writer terminé (sortie du with) -> flush final synchrone.
+        # Toujours persister les post_id déjà créés sur FB (sinon doublons au prochain run)
+        _flush_posts(sb, pending_posts, events)
+
+    summary = {
+        "run_id": run_id,
+        "inv_count": inv_count,
+        "new": len(new_slugs),
+        "sold": len(disappeared_slugs),
+        "price_changed": len(price_changed),
+        "targets": len(targets),
+    }
+    events.log("RUN", "RUN_SUMMARY", summary)
+    events.flush()
+    print(f"OK run_id={run_id} inv_count={inv_count} NEW={summary['new']} SOLD={summary['sold']} PRICE_CHANGED={summary['price_changed']}")
 
 
 if __name__ == "__main__":
@@ -13,12 +13,19 @@ import os
 import re
 import io
 import csv
-import json
 import time
+import hashlib
+import heapq
+from collections import namedtuple
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 from kennebec_scrape import (
@@ -28,12 +35,16 @@ from kennebec_scrape import (
     slugify,
 )
 
-from text_engine_client import generate_facebook_text
+from text_engine_client import generate_facebook_text, FALLBACK_MARKER
 from fb_api import (
     publish_photos_unpublished,
     create_post_with_attached_media,
-    update_post_text,
+    update_posts_text_batch,
+    fetch_posts_messages_batch,
+    fetch_fb_post_message,
+    FB_BATCH_MAX,
     publish_photos_as_comment_batch,
+    fb_usage_pct,
 )
 
 from supabase_db import (
@@ -42,17 +53,23 @@ from supabase_db import (
     get_posts_map,
     upsert_inventory,
     upsert_post,
-    log_event,
+    upsert_posts,
+    update_posts_by_post_id,
+    BufferedEventLog,
     utc_now_iso,
+    json_dumps_bytes,
+    json_loads,
     upload_json_to_storage,
     upload_bytes_to_storage,
     cleanup_storage_runs,
+    cleanup_storage_older_than,
+    list_storage_names,
     upsert_scrape_run,
     upsert_raw_page,
     upsert_sticker_pdf,
 )
 
-from sticker_to_ad import extract_spans_pdfminer, extract_option_groups_from_spans
+from sticker_to_ad import extract_spans_pdfminer, extract_spans_pymupdf, extract_option_groups_from_spans
 from ad_builder import build_ad as build_ad_from_options
 
 
@@ -73,6 +90,11 @@ BASE_URL = os.getenv("KENBOT_BASE_URL", "https://www.kennebecdodge.ca").rstrip("
 INVENTORY_PATH = os.getenv("KENBOT_INVENTORY_PATH", "/fr/inventaire-occasion/").strip()
 
 TEXT_ENGINE_URL = (os.getenv("KENBOT_TEXT_ENGINE_URL") or "").strip()
+# Cache des textes text-engine (mémoire + storage text_cache/), clé = hash du payload
+TEXT_CACHE = os.getenv("KENBOT_TEXT_CACHE", "1").strip() == "1"
+TEXT_CACHE_VERSION = os.getenv("KENBOT_TEXT_CACHE_VERSION", "v1").strip() or "v1"
+# text_cache/*.txt (OUTPUTS_BUCKET) plus vieux que N jours supprimés à chaque run (0 = jamais)
+TEXT_CACHE_KEEP_DAYS = int(os.getenv("KENBOT_TEXT_CACHE_KEEP_DAYS", "14").strip() or "14")
 
 FB_PAGE_ID = (os.getenv("KENBOT_FB_PAGE_ID") or os.getenv("FB_PAGE_ID") or "").strip()
 FB_TOKEN = (os.getenv("KENBOT_FB_ACCESS_TOKEN") or os.getenv("FB_PAGE_ACCESS_TOKEN") or "").strip()
@@ -90,12 +112,35 @@ RUN_MODE = os.getenv("KENBOT_RUN_MODE", "FULL").strip().upper()  # FULL | FB
 
 MAX_TARGETS = int(os.getenv("KENBOT_MAX_TARGETS", "4").strip() or "4")
 SLEEP_BETWEEN = int(os.getenv("KENBOT_SLEEP_BETWEEN_POSTS", "30").strip() or "30")
+# Pause entre NEW posts selon l'usage Graph (X-App-Usage/X-Page-Usage): au-dessus du
+# seuil on ralentit (jusqu'à 4x SLEEP_BETWEEN); en dessous, FB_MIN_SLEEP si adaptatif activé
+FB_ADAPTIVE_SLEEP = os.getenv("KENBOT_FB_ADAPTIVE_SLEEP", "0").strip() == "1"
+FB_USAGE_THRESHOLD = int(os.getenv("KENBOT_FB_USAGE_THRESHOLD", "70").strip() or "70")
+FB_MIN_SLEEP = int(os.getenv("KENBOT_FB_MIN_SLEEP", "5").strip() or "5")
+DETAIL_WORKERS = int(os.getenv("KENBOT_DETAIL_WORKERS", "8").strip() or "8")
+
+# _site_price_quick: page véhicule lue en streaming, par blocs, jusqu'au prix
+SITE_PRICE_CHUNK = int(os.getenv("KENBOT_SITE_PRICE_CHUNK", "98304").strip() or "98304")
+SITE_PRICE_MAX_CHUNKS = int(os.getenv("KENBOT_SITE_PRICE_MAX_CHUNKS", "2").strip() or "2")
+
+# Pool HTTP (keep-alive) partagé par SESSION (>= workers, sinon connexions jetées)
+HTTP_POOL_SIZE = int(os.getenv("KENBOT_HTTP_POOL_SIZE", "32").strip() or "32")
 
 MAX_PHOTOS = int(os.getenv("KENBOT_MAX_PHOTOS", "15").strip() or "15")
 POST_PHOTOS = int(os.getenv("KENBOT_POST_PHOTOS", "10").strip() or "10")
+PHOTO_WORKERS = int(os.getenv("KENBOT_PHOTO_WORKERS", "8").strip() or "8")
+PHOTO_CACHE = os.getenv("KENBOT_PHOTO_CACHE", "1").strip() == "1"
+PHOTO_CACHE_MIN_BYTES = int(os.getenv("KENBOT_PHOTO_CACHE_MIN_BYTES", "1024").strip() or "1024")
 
 CACHE_STICKERS = os.getenv("KENBOT_CACHE_STICKERS", "1").strip() == "1"
 STICKER_MAX = int(os.getenv("KENBOT_STICKER_MAX", "999").strip() or "999")
+STICKER_WORKERS = int(os.getenv("KENBOT_STICKER_WORKERS", "8").strip() or "8")
+TEXT_WORKERS = int(os.getenv("KENBOT_TEXT_WORKERS", "4").strip() or "4")
+EVENTS_BATCH = int(os.getenv("KENBOT_EVENTS_BATCH", "256").strip() or "256")
+# 0 = events bruts (debug), 1 = doublons exacts fusionnés avec un compteur
+EVENTS_DEDUPE = os.getenv("KENBOT_EVENTS_DEDUPE", "1").strip() == "1"
+# PyMuPDF (optionnel) pour parser les stickers: opt-in, fallback pdfminer si absent/vide
+STICKER_PYMUPDF = os.getenv("KENBOT_STICKER_PYMUPDF", "0").strip() == "1"
 
 RAW_KEEP = int(os.getenv("KENBOT_RAW_KEEP", "2").strip() or "2")
 SNAP_KEEP = int(os.getenv("KENBOT_SNAP_KEEP", "10").strip() or "10")
@@ -148,7 +193,21 @@ if not FB_PAGE_ID or not FB_TOKEN:
 if not TEXT_ENGINE_URL:
     raise SystemExit("🛑 KENBOT_TEXT_ENGINE_URL manquant")
 
+# Session partagée (keep-alive) + retry urllib3 sur erreurs de connexion et 429/5xx (GET).
+# Accept-Encoding gzip/deflate est déjà envoyé par défaut par requests.
 SESSION = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=HTTP_POOL_SIZE,
+    pool_maxsize=HTTP_POOL_SIZE,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.4,
+        status_forcelist=(429, 500, 502, 503, 504),
+        raise_on_status=False,
+    ),
+)
+SESSION.mount("https://", _HTTP_ADAPTER)
+SESSION.mount("http://", _HTTP_ADAPTER)
 SESSION.headers.update({
     "User-Agent": "Mozilla/5.0 (KenBot runner_cron_prod)",
     "Accept-Language": "fr-CA,fr;q=0.9,en;q=0.8",
@@ -158,37 +217,99 @@ SESSION.headers.update({
 # -------------------------
 # Helpers
 # -------------------------
+# Séparateurs ISO-8601 retirés d'un coup (str.translate, boucle C)
+_ISO_SEPARATORS = str.maketrans("", "", "-:T.Z+ ")
+
 def _run_id_from_now(now_iso: str) -> str:
-    digits = "".join(ch for ch in (now_iso or "") if ch.isdigit())
-    if len(digits) >= 14:
+    digits = (now_iso or "").translate(_ISO_SEPARATORS)
+    if len(digits) >= 14 and digits[:14].isdigit():
         return f"{digits[0:8]}_{digits[8:14]}"
     return f"run_{int(time.time())}"
 
 def _is_pdf_ok(b: bytes) -> bool:
-    return bool(b) and len(b) >= 10_240 and b[:4] == b"%PDF"
+    return len(b or b"") >= 10_240 and b[:4] == b"%PDF"
+
+# Champs véhicule normalisés une seule fois (strip/upper) pour les passes feed/rapport/refresh
+VehicleRec = namedtuple("VehicleRec", "stock vin title url price_int km_int first_photo")
+
+def _canonicalize(v: Dict[str, Any]) -> VehicleRec:
+    photos = v.get("photos") or []
+    price_int = v.get("price_int")
+    km_int = v.get("km_int")
+    return VehicleRec(
+        stock=(v.get("stock") or "").strip().upper(),
+        vin=(v.get("vin") or "").strip().upper(),
+        title=(v.get("title") or "").strip(),
+        url=(v.get("url") or "").strip(),
+        price_int=price_int if isinstance(price_int, int) else None,
+        km_int=km_int if isinstance(km_int, int) else None,
+        first_photo=(photos[0] or "").strip() if photos else "",
+    )
+
+@dataclass(slots=True)
+class InvRef:
+    """Row inventory DB pré-normalisé (status/stock upper) pour les boucles du main."""
+    status: str
+    stock: str
+    price_int: Optional[int]
+
+    @classmethod
+    def from_row(cls, r: Dict[str, Any]) -> "InvRef":
+        return cls(
+            status=(r.get("status") or "").upper(),
+            stock=(r.get("stock") or "").strip().upper(),
+            price_int=r.get("price_int"),
+        )
+
+@dataclass(slots=True)
+class PostRef:
+    """Row posts DB pré-normalisé (status upper, base_text strip) pour les boucles du main."""
+    post_id: Optional[str]
+    status: str
+    stock: Optional[str]
+    base_text: str
+
+    @classmethod
+    def from_row(cls, p: Dict[str, Any]) -> "PostRef":
+        return cls(
+            post_id=p.get("post_id") or None,
+            status=str(p.get("status") or "").upper(),
+            stock=p.get("stock"),
+            base_text=(p.get("base_text") or "").strip(),
+        )
+
+_NO_POST = PostRef(post_id=None, status="", stock=None, base_text="")
+
+# WMI Stellantis: lookup set O(1) au lieu d'un startswith() sur tuple
+_STELL_PREFIX2 = frozenset({"1C", "2C", "3C"})
+_STELL_PREFIX3 = frozenset({"ZAC", "ZFA"})
 
 def _is_stellantis_vin(vin: str) -> bool:
     vin = (vin or "").strip().upper()
-    return len(vin) == 17 and vin.startswith(("1C", "2C", "3C", "ZAC", "ZFA"))
+    return len(vin) == 17 and (vin[:2] in _STELL_PREFIX2 or vin[:3] in _STELL_PREFIX3)
+
+# Regex compilées une fois (feed Meta / rapport prix)
+_YEAR_RE = re.compile(r"\b(19\d{2}|20\d{2})\b")
+_PRICE_RE = re.compile(r"(\d[\d\s]{2,})\s*\$")
+
+SOLD_MARKER = "🚨 VENDU 🚨"
+
+# Bannière VENDU = tout jusqu'à la fin de la ligne séparateur incluse
+_SOLD_BANNER_RE = re.compile(r"\A" + re.escape(SOLD_MARKER) + r".*?────────────────────", re.S)
 
 def _strip_sold_banner(txt: str) -> str:
     t = (txt or "").lstrip()
-    if not t.startswith("🚨 VENDU 🚨"):
+    if not t.startswith(SOLD_MARKER):  # fast-path: pas de bannière => pas de regex
         return t
-    lines = t.splitlines()
-    out = []
-    cutting = True
-    for line in lines:
-        if cutting:
-            if "────────────────────" in line:
-                cutting = False
-            continue
-        out.append(line)
-    return ("\n".join(out)).lstrip()
+    m = _SOLD_BANNER_RE.match(t)
+    if not m:
+        return ""
+    # splitlines() comme avant: reste de la ligne séparateur coupé, \r\n normalisés, pas de \n final
+    return "\n".join(t[m.end():].splitlines()[1:]).lstrip()
 
 def _sold_prefix() -> str:
     return (
-        "🚨 VENDU 🚨\n\n"
+        f"{SOLD_MARKER}\n\n"
         "Ce véhicule n’est plus disponible.\n\n"
         "👉 Vous recherchez un véhicule semblable ?\n"
         "Contactez-moi directement, je peux vous aider.\n\n"
@@ -197,18 +318,20 @@ def _sold_prefix() -> str:
         "────────────────────\n\n"
     )
 
+SOLD_PREFIX = _sold_prefix()
+
 def _make_sold_message(base_text: str) -> str:
     base = _strip_sold_banner(base_text).strip()
     if not base:
         base = "(Détails indisponibles — contactez-moi.)"
-    return _sold_prefix() + base
+    return SOLD_PREFIX + base
 
 def acquire_lock_or_exit(sb) -> None:
     now = int(time.time())
     try:
         b = sb.storage.from_(OUTPUTS_BUCKET).download(LOCK_PATH)
         if b:
-            data = json.loads(b.decode("utf-8", "ignore"))
+            data = json_loads(b)
             ts = int(data.get("ts", 0))
             if (now - ts) < LOCK_TTL_SEC:
                 print("🔒 LOCK: un autre run est en cours → exit", flush=True)
@@ -216,7 +339,7 @@ def acquire_lock_or_exit(sb) -> None:
     except Exception:
         pass
 
-    payload = json.dumps({"ts": now, "mode": RUN_MODE}).encode("utf-8")
+    payload = json_dumps_bytes({"ts": now, "mode": RUN_MODE})
     sb.storage.from_(OUTPUTS_BUCKET).upload(
         LOCK_PATH,
         payload,
@@ -234,30 +357,92 @@ def _download_photo(url: str, out_path: Path) -> None:
     r.raise_for_status()
     out_path.write_bytes(r.content)
 
+def _ext_for(url: str) -> str:
+    low = url.lower()
+    if ".png" in low:
+        return ".png"
+    if ".webp" in low:
+        return ".webp"
+    return ".jpg"
+
+def _try_download_photo(job: Tuple[str, Path, bool]) -> Optional[Path]:
+    u, p, cached = job
+    # Cache disque: même URL déjà téléchargée (et fichier non tronqué) -> pas de re-download
+    if cached and p.exists() and p.stat().st_size > PHOTO_CACHE_MIN_BYTES:
+        return p
+    try:
+        _download_photo(u, p)
+        return p
+    except Exception:
+        return None
+
 def _download_photos(stock: str, urls: List[str], limit: int) -> List[Path]:
-    out: List[Path] = []
     stock = (stock or "UNKNOWN").strip().upper()
     folder = TMP_PHOTOS / stock
     folder.mkdir(parents=True, exist_ok=True)
 
+    # index nom_fichier -> URL source des photos déjà sur disque
+    index_path = folder / "_photos.json"
+    index: Dict[str, str] = {}
+    if PHOTO_CACHE:
+        try:
+            index = json_loads(index_path.read_bytes()) or {}
+        except Exception:
+            index = {}
+
+    jobs = []
     for i, u in enumerate(urls[:limit], start=1):
         if not u:
             continue
-        ext = ".jpg"
-        low = u.lower()
-        if ".png" in low:
-            ext = ".png"
-        elif ".webp" in low:
-            ext = ".webp"
-        p = folder / f"{stock}_{i:02d}{ext}"
+        p = folder / f"{stock}_{i:02d}{_ext_for(u)}"
+        jobs.append((u, p, PHOTO_CACHE and index.get(p.name) == u))
+    if not jobs:
+        return []
+
+    # Photos indépendantes: téléchargement en parallèle (ordre conservé)
+    with ThreadPoolExecutor(max_workers=max(1, min(PHOTO_WORKERS, len(jobs)))) as pool:
+        results = list(pool.map(_try_download_photo, jobs))
+
+    out: List[Path] = []
+    for (u, p, _), res in zip(jobs, results):
+        if res is None:
+            index.pop(p.name, None)
+            continue
+        index[p.name] = u
+        out.append(res)
+
+    if PHOTO_CACHE:
         try:
-            _download_photo(u, p)
-            out.append(p)
+            index_path.write_bytes(json_dumps_bytes(index))
         except Exception:
-            continue
+            pass
     return out
 
-def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
+def _list_sticker_vins(sb, folder: str) -> Optional[set]:
+    """
+    VINs présents dans STICKERS_BUCKET/<folder> (un seul listing).
+    None si le listing échoue (=> ensure_sticker_cached retombe sur les probes download).
+    """
+    try:
+        names = list_storage_names(sb, STICKERS_BUCKET, folder)
+    except Exception:
+        return None
+    return {n[:-4].upper() for n in names if n.lower().endswith(".pdf")}
+
+# Statut sticker ("ok"/"bad") par VIN, rempli par la passe stickers du run
+_STICKER_STATUS: Dict[str, str] = {}
+
+def ensure_sticker_cached(
+    sb,
+    vin: str,
+    run_id: str,
+    ok_vins: Optional[set] = None,
+    bad_vins: Optional[set] = None,
+) -> Dict[str, Any]:
+    """
+    ok_vins / bad_vins: listings pré-chargés de pdf_ok / pdf_bad.
+    Quand fournis, on ne télécharge que les PDFs qui existent vraiment.
+    """
     vin = (vin or "").strip().upper()
     if len(vin) != 17:
         return {"vin": vin, "status": "skip", "reason": "vin_invalid"}
@@ -265,19 +450,23 @@ def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
     ok_path = f"pdf_ok/{vin}.pdf"
     bad_path = f"pdf_bad/{vin}.pdf"
 
-    try:
-        blob = sb.storage.from_(STICKERS_BUCKET).download(ok_path)
-    except Exception:
-        blob = None
+    blob = None
+    if ok_vins is None or vin in ok_vins:
+        try:
+            blob = sb.storage.from_(STICKERS_BUCKET).download(ok_path)
+        except Exception:
+            blob = None
 
     if _is_pdf_ok(blob or b""):
         upsert_sticker_pdf(sb, vin=vin, status="ok", storage_path=ok_path, data=blob, reason="", run_id=run_id)
-        return {"vin": vin, "status": "ok", "path": ok_path}
+        return {"vin": vin, "status": "ok", "path": ok_path, "data": blob}
 
-    try:
-        blob_bad = sb.storage.from_(STICKERS_BUCKET).download(bad_path)
-    except Exception:
-        blob_bad = None
+    blob_bad = None
+    if bad_vins is None or vin in bad_vins:
+        try:
+            blob_bad = sb.storage.from_(STICKERS_BUCKET).download(bad_path)
+        except Exception:
+            blob_bad = None
 
     if blob_bad is not None and len(blob_bad) > 0:
         upsert_sticker_pdf(sb, vin=vin, status="bad", storage_path=bad_path, data=blob_bad, reason="cached_bad", run_id=run_id)
@@ -293,7 +482,7 @@ def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
     if _is_pdf_ok(fetched):
         upload_bytes_to_storage(sb, STICKERS_BUCKET, ok_path, fetched, content_type="application/pdf", upsert=True)
         upsert_sticker_pdf(sb, vin=vin, status="ok", storage_path=ok_path, data=fetched, reason="", run_id=run_id)
-        return {"vin": vin, "status": "ok", "path": ok_path}
+        return {"vin": vin, "status": "ok", "path": ok_path, "data": fetched}
 
     blob_store = fetched if fetched else b"x"
     upload_bytes_to_storage(sb, STICKERS_BUCKET, bad_path, blob_store, content_type="application/pdf", upsert=True)
@@ -303,19 +492,27 @@ def ensure_sticker_cached(sb, vin: str, run_id: str) -> Dict[str, Any]:
 def _extract_options_from_sticker_bytes(pdf_bytes: bytes) -> List[Dict[str, Any]]:
     if not _is_pdf_ok(pdf_bytes):
         return []
-    tmp = Path("/tmp") / f"sticker_{int(time.time())}.pdf"
-    tmp.write_bytes(pdf_bytes)
+    if STICKER_PYMUPDF:
+        try:
+            groups = extract_option_groups_from_spans(extract_spans_pymupdf(pdf_bytes, max_pages=2)) or []
+            groups = [g for g in groups if (g.get("title") or "").strip()]
+            if groups:
+                return groups
+        except Exception:
+            pass
     try:
-        spans = extract_spans_pdfminer(tmp, max_pages=2)
+        # Parse en mémoire (pas d'aller-retour /tmp)
+        spans = extract_spans_pdfminer(io.BytesIO(pdf_bytes), max_pages=2)
         groups = extract_option_groups_from_spans(spans) or []
         return [g for g in groups if (g.get("title") or "").strip()]
     except Exception:
         return []
-    finally:
-        try:
-            tmp.unlink(missing_ok=True)
-        except Exception:
-            pass
+
+def _fetch_vehicle_detail(url: str) -> Optional[Dict[str, Any]]:
+    try:
+        return parse_vehicle_detail_simple(SESSION, url)
+    except Exception:
+        return None
 
 def _today_key_utc() -> str:
     ts = time.gmtime()
@@ -330,7 +527,7 @@ def _try_daily_guard(sb, prefix: str) -> bool:
     except Exception:
         pass
 
-    payload = json.dumps({"ts": int(time.time()), "prefix": prefix}).encode("utf-8")
+    payload = json_dumps_bytes({"ts": int(time.time()), "prefix": prefix})
     sb.storage.from_(OUTPUTS_BUCKET).upload(
         path,
         payload,
@@ -340,20 +537,59 @@ def _try_daily_guard(sb, prefix: str) -> bool:
 
 def _best_row_per_stock(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     rank = {"ACTIVE": 3, "MISSING": 2, "SOLD": 1}
-    tmp: Dict[str, List[Dict[str, Any]]] = {}
+    # Une seule passe: on garde le meilleur (clé max) par stock, sans tri
+    best: Dict[str, Tuple[Tuple[int, str, str], Dict[str, Any]]] = {}
     for r in rows or []:
         st = (r.get("stock") or "").strip().upper()
         if not st:
             continue
-        tmp.setdefault(st, []).append(r)
-
-    out: Dict[str, Dict[str, Any]] = {}
-    def key(r):
-        st = (r.get("status") or "").upper()
-        return (rank.get(st, 0), (r.get("updated_at") or ""), (r.get("last_seen") or ""))
-    for st, lst in tmp.items():
-        out[st] = sorted(lst, key=key, reverse=True)[0]
-    return out
+        k = (
+            rank.get((r.get("status") or "").upper(), 0),
+            (r.get("updated_at") or ""),
+            (r.get("last_seen") or ""),
+        )
+        cur = best.get(st)
+        if cur is None or k > cur[0]:
+            best[st] = (k, r)
+    return {st: r for st, (_, r) in best.items()}
+
+class _TextNotCacheable(Exception):
+    """Texte vide / mode secours: retourné tel quel, jamais mis en cache."""
+
+@lru_cache(maxsize=2048)
+def _gen_text_cached(sb, key: str, slug: str, event: str, payload_json: bytes) -> str:
+    path = f"text_cache/{key}.txt"
+    try:
+        b = sb.storage.from_(OUTPUTS_BUCKET).download(path)
+        if b:
+            return b.decode("utf-8")
+    except Exception:
+        pass
+
+    txt = generate_facebook_text(TEXT_ENGINE_URL, slug, event, json_loads(payload_json))
+    if not txt or FALLBACK_MARKER in txt:
+        raise _TextNotCacheable(txt)
+
+    try:
+        sb.storage.from_(OUTPUTS_BUCKET).upload(
+            path,
+            txt.encode("utf-8"),
+            {"content-type": "text/plain; charset=utf-8", "x-upsert": "true"},
+        )
+    except Exception:
+        pass
+    return txt
+
+def _generate_text(sb, slug: str, event: str, v: Dict[str, Any]) -> str:
+    """generate_facebook_text avec cache: 1 seul appel text-engine par (slug, event, payload) unique."""
+    if not TEXT_CACHE:
+        return generate_facebook_text(TEXT_ENGINE_URL, slug, event, v)
+    payload_json = json_dumps_bytes(v, sort_keys=True)
+    key = hashlib.sha256(f"{TEXT_CACHE_VERSION}|{slug}|{event}|".encode("utf-8") + payload_json).hexdigest()
+    try:
+        return _gen_text_cached(sb, key, slug, event, payload_json)
+    except _TextNotCacheable as e:
+        return e.args[0]
 
 def _build_ad_text(sb, run_id: str, slug: str, v: Dict[str, Any], event: str) -> str:
     vin = (v.get("vin") or "").strip().upper()
@@ -369,12 +605,18 @@ def _build_ad_text(sb, run_id: str, slug: str, v: Dict[str, Any], event: str) ->
     if not mileage and isinstance(v.get("km_int"), int):
         mileage = f"{v['km_int']} km"
 
-    if USE_STICKER_AD and _is_stellantis_vin(vin):
+    if USE_STICKER_AD and _is_stellantis_vin(vin) and _STICKER_STATUS.get(vin) != "bad":
         try:
-            res = ensure_sticker_cached(sb, vin, run_id)
+            if _STICKER_STATUS.get(vin) == "ok":
+                # déjà validé par la passe stickers de ce run: un seul download, pas de re-probe
+                res = {"status": "ok", "path": f"pdf_ok/{vin}.pdf"}
+            else:
+                res = ensure_sticker_cached(sb, vin, run_id)
             if (res.get("status") or "").lower() == "ok":
-                pdf_path = res.get("path") or f"pdf_ok/{vin}.pdf"
-                pdf_bytes = sb.storage.from_(STICKERS_BUCKET).download(pdf_path)
+                pdf_bytes = res.get("data")
+                if not pdf_bytes:
+                    pdf_path = res.get("path") or f"pdf_ok/{vin}.pdf"
+                    pdf_bytes = sb.storage.from_(STICKERS_BUCKET).download(pdf_path)
                 options = _extract_options_from_sticker_bytes(pdf_bytes)
                 if options:
                     txt = build_ad_from_options(
@@ -391,9 +633,9 @@ def _build_ad_text(sb, run_id: str, slug: str, v: Dict[str, Any], event: str) ->
         except Exception as e:
             print(f"STICKER_TO_AD: FAIL vin={vin} stock={stock} err={e}", flush=True)
 
-    return generate_facebook_text(TEXT_ENGINE_URL, slug, event, v)
+    return _generate_text(sb, slug, event, v)
 
-def daily_audit_and_fix(sb, run_id: str) -> dict:
+def daily_audit_and_fix(sb, run_id: str, events: BufferedEventLog) -> dict:
     if RUN_MODE != "FULL":
         return {"skipped": "not_full"}
     if not DAILY_FIX:
@@ -401,126 +643,181 @@ def daily_audit_and_fix(sb, run_id: str) -> dict:
     if not _try_daily_guard(sb, "daily_fix"):
         return {"skipped": "already_done_today"}
 
+    now = utc_now_iso()  # un seul timestamp pour toutes les corrections de la passe
+
+    # Un seul listing pdf_ok au lieu d'un download complet du PDF par stock
+    # (None si le listing échoue => probe par VIN comme avant)
+    ok_vins = _list_sticker_vins(sb, "pdf_ok")
+
     inv_rows = (
         sb.table("inventory")
         .select("stock,slug,title,url,vin,price_int,km_int,status,updated_at,last_seen")
         .eq("status", "ACTIVE")
+        .order("updated_at", desc=True, nullsfirst=False)
+        .order("last_seen", desc=True, nullsfirst=False)
         .limit(5000)
         .execute()
         .data
         or []
     )
-    site_by_stock = _best_row_per_stock(inv_rows)
+    # Tous ACTIVE + tri Postgres (updated_at, last_seen desc): le premier row par stock
+    # est le meilleur, même résultat que _best_row_per_stock sans ranking côté client
+    site_by_stock: Dict[str, Dict[str, Any]] = {}
+    for r in inv_rows:
+        st = (r.get("stock") or "").strip().upper()
+        if st:
+            site_by_stock.setdefault(st, r)
     site_stocks = sorted(site_by_stock.keys())
 
     posts_rows = (
         sb.table("posts")
         .select("post_id,stock,slug,status,base_text,last_updated_at,sold_at")
         .neq("post_id", None)
+        .order("last_updated_at", desc=True, nullsfirst=False)
         .limit(5000)
         .execute()
         .data
         or []
     )
 
+    # Rows triés par last_updated_at desc (Postgres): le premier vu par stock = le plus récent
     posts_by_stock = {}
     for p in posts_rows:
         st = (p.get("stock") or "").strip().upper()
-        if not st:
-            continue
-        cur = posts_by_stock.get(st)
-        if not cur or (p.get("last_updated_at") or "") > (cur.get("last_updated_at") or ""):
-            posts_by_stock[st] = p
+        if st:
+            posts_by_stock.setdefault(st, p)
 
     restored = 0
     text_fixed = 0
     checked = 0
     missing_post = 0
 
-    for stock in site_stocks[:DAILY_FIX_LIMIT]:
-        site = site_by_stock.get(stock) or {}
-        p = posts_by_stock.get(stock)
+    # Corrections posts écrites après la passe: de vrais UPDATE ... WHERE post_id
+    # (jamais d'insert si la ligne a disparu), envoyés en parallèle.
+    # Clé post_id: restore + fix texte fusionnés.
+    pending: Dict[str, Dict[str, Any]] = {}
+
+    def _queue_post_fix(post_id: str, stock: str, fields: Dict[str, Any], fail: str) -> None:
+        e = pending.setdefault(post_id, {"stock": stock, "fields": {}})
+        e["fields"].update(fields)
+        e["fields"]["last_updated_at"] = now
+        e["fail"] = fail
+
+    def _write_post_fixes() -> None:
+        errors = update_posts_by_post_id(sb, {pid: e["fields"] for pid, e in pending.items()})
+        for pid, err in errors.items():
+            e = pending[pid]
+            events.log(e["stock"], e["fail"], {"post_id": pid, "err": err, "run_id": run_id})
+        pending.clear()
+
+    # Edits FB bufferisés, envoyés via Graph ?batch= (FB_BATCH_MAX ops par POST).
+    # Clé post_id: restore + fix texte du même post fusionnés (dernier texte gagne).
+    fb_edits: Dict[str, Dict[str, Any]] = {}
+
+    def _flush_fb_edits() -> None:
+        if not fb_edits:
+            return
+        edits = list(fb_edits.items())
+        fb_edits.clear()
+        errors = update_posts_text_batch([(pid, e["text"]) for pid, e in edits], FB_TOKEN)
+        for (pid, e), err in zip(edits, errors):
+            if err is None:
+                _queue_post_fix(pid, e["stock"], e["fields"], e["fail"])
+            else:
+                events.log(e["stock"], e["fail"], {"post_id": pid, "err": err, "run_id": run_id})
+        time.sleep(max(2, DAILY_FIX_SLEEP))
+
+    def _queue_fb_edit(post_id: str, stock: str, text: str, fields: Dict[str, Any], fail: str) -> None:
+        e = fb_edits.setdefault(post_id, {"stock": stock, "fields": {}})
+        e["text"] = text
+        e["fields"].update(fields)
+        e["fail"] = fail
+        if len(fb_edits) >= FB_BATCH_MAX:
+            _flush_fb_edits()
 
-        if not p or not p.get("post_id"):
-            missing_post += 1
-            continue
+    try:
+        for stock in site_stocks[:DAILY_FIX_LIMIT]:
+            site = site_by_stock.get(stock) or {}
+            p = posts_by_stock.get(stock)
 
-        post_id = p["post_id"]
-        fb_status = (p.get("status") or "").upper()
-        base_text = (p.get("base_text") or "").strip()
-        has_sold_banner = base_text.lstrip().startswith("🚨 VENDU 🚨")
+            if not p or not p.get("post_id"):
+                missing_post += 1
+                continue
 
-        if fb_status == "SOLD" or has_sold_banner:
-            restore_text = _strip_sold_banner(base_text) if base_text else ""
-            if not restore_text:
-                payload = {
-                    "slug": (site.get("slug") or p.get("slug") or "").strip(),
-                    "stock": stock,
-                    "title": (site.get("title") or "").strip(),
-                    "url": (site.get("url") or "").strip(),
-                    "vin": (site.get("vin") or "").strip(),
-                    "price_int": site.get("price_int"),
-                    "km_int": site.get("km_int"),
-                }
-                restore_text = _build_ad_text(sb, run_id, payload["slug"] or stock, payload, event="PRICE_CHANGED")
-
-            if not DRY_RUN:
-                try:
-                    update_post_text(post_id, FB_TOKEN, restore_text)
-                    sb.table("posts").update({
+            post_id = p["post_id"]
+            fb_status = (p.get("status") or "").upper()
+            base_text = (p.get("base_text") or "").strip()
+            has_sold_banner = base_text.lstrip().startswith(SOLD_MARKER)
+
+            if fb_status == "SOLD" or has_sold_banner:
+                # DRY_RUN: le texte de restauration ne sert qu'à l'edit FB -> pas de text-engine
+                restore_text = _strip_sold_banner(base_text) if base_text else ""
+                if not restore_text and not DRY_RUN:
+                    payload = {
+                        "slug": (site.get("slug") or p.get("slug") or "").strip(),
+                        "stock": stock,
+                        "title": (site.get("title") or "").strip(),
+                        "url": (site.get("url") or "").strip(),
+                        "vin": (site.get("vin") or "").strip(),
+                        "price_int": site.get("price_int"),
+                        "km_int": site.get("km_int"),
+                    }
+                    restore_text = _build_ad_text(sb, run_id, payload["slug"] or stock, payload, event="PRICE_CHANGED")
+
+                if not DRY_RUN:
+                    _queue_fb_edit(post_id, stock, restore_text, {
                         "status": "ACTIVE",
                         "sold_at": None,
-                        "last_updated_at": utc_now_iso(),
                         "base_text": restore_text,
-                    }).eq("post_id", post_id).execute()
-                    time.sleep(max(2, DAILY_FIX_SLEEP))
-                except Exception as e:
-                    log_event(sb, stock, "DAILY_RESTORE_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
-            restored += 1
-
-        vin = (site.get("vin") or "").strip().upper()
-        has_pdf_ok = False
-        if vin and len(vin) == 17:
-            try:
-                pdf = sb.storage.from_(STICKERS_BUCKET).download(f"pdf_ok/{vin}.pdf")
-                has_pdf_ok = bool(pdf) and pdf[:4] == b"%PDF"
-            except Exception:
-                has_pdf_ok = False
-
-        payload = {
-            "slug": (site.get("slug") or p.get("slug") or "").strip(),
-            "stock": stock,
-            "title": (site.get("title") or "").strip(),
-            "url": (site.get("url") or "").strip(),
-            "vin": vin,
-            "price_int": site.get("price_int"),
-            "km_int": site.get("km_int"),
-        }
-
-        if has_pdf_ok:
-            new_text = _build_ad_text(sb, run_id, payload["slug"] or stock, payload, event="PRICE_CHANGED")
-        elif DAILY_FIX_FALLBACK:
-            new_text = generate_facebook_text(TEXT_ENGINE_URL, payload["slug"] or stock, "PRICE_CHANGED", payload)
-        else:
-            new_text = None
-
-        if new_text:
-            cur_text = (p.get("base_text") or "").strip()
-            if cur_text.strip() != new_text.strip():
-                if not DRY_RUN:
+                    }, fail="DAILY_RESTORE_FAIL")
+                restored += 1
+
+            vin = (site.get("vin") or "").strip().upper()
+            has_pdf_ok = False
+            if vin and len(vin) == 17:
+                if ok_vins is not None:
+                    has_pdf_ok = vin in ok_vins
+                else:
                     try:
-                        update_post_text(post_id, FB_TOKEN, new_text)
-                        sb.table("posts").update({
+                        pdf = sb.storage.from_(STICKERS_BUCKET).download(f"pdf_ok/{vin}.pdf")
+                        has_pdf_ok = bool(pdf) and pdf[:4] == b"%PDF"
+                    except Exception:
+                        has_pdf_ok = False
+
+            payload = {
+                "slug": (site.get("slug") or p.get("slug") or "").strip(),
+                "stock": stock,
+                "title": (site.get("title") or "").strip(),
+                "url": (site.get("url") or "").strip(),
+                "vin": vin,
+                "price_int": site.get("price_int"),
+                "km_int": site.get("km_int"),
+            }
+
+            if has_pdf_ok:
+                new_text = _build_ad_text(sb, run_id, payload["slug"] or stock, payload, event="PRICE_CHANGED")
+            elif DAILY_FIX_FALLBACK:
+                new_text = _generate_text(sb, payload["slug"] or stock, "PRICE_CHANGED", payload)
+            else:
+                new_text = None
+
+            if new_text:
+                cur_text = (p.get("base_text") or "").strip()
+                if cur_text.strip() != new_text.strip():
+                    if not DRY_RUN:
+                        _queue_fb_edit(post_id, stock, new_text, {
                             "base_text": new_text,
-                            "last_updated_at": utc_now_iso(),
                             "status": "ACTIVE",
-                        }).eq("post_id", post_id).execute()
-                        time.sleep(max(2, DAILY_FIX_SLEEP))
-                    except Exception as e:
-                        log_event(sb, stock, "DAILY_TEXT_FIX_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
-                text_fixed += 1
+                        }, fail="DAILY_TEXT_FIX_FAIL")
+                    text_fixed += 1
 
-        checked += 1
+            checked += 1
+    finally:
+        try:
+            _flush_fb_edits()
+        finally:
+            if pending:
+                _write_post_fixes()
 
     return {
         "checked": checked,
@@ -530,24 +827,19 @@ def daily_audit_and_fix(sb, run_id: str) -> dict:
         "site_count": len(site_stocks),
     }
 
-def build_meta_vehicle_feed_csv(current: Dict[str, Any]) -> bytes:
-    fieldnames = ["id","title","description","availability","condition","price","link","image_link","brand","year"]
-    buf = io.StringIO()
-    w = csv.DictWriter(buf, fieldnames=fieldnames)
-    w.writeheader()
-
-    for _, v in (current or {}).items():
-        stock = (v.get("stock") or "").strip().upper()
-        url = (v.get("url") or "").strip()
-        title = (v.get("title") or "").strip()
-        price_int = v.get("price_int")
-
-        if not isinstance(price_int, int):
+META_FEED_FIELDS = ("id", "title", "description", "availability", "condition", "price", "link", "image_link", "brand", "year")
+
+def _meta_feed_rows(current: Dict[str, Any]):
+    """Rows (tuples positionnels) du feed Meta, dans l'ordre des colonnes de META_FEED_FIELDS."""
+    for v in (current or {}).values():
+        rec = _canonicalize(v)
+        stock, url, title, price_int = rec.stock, rec.url, rec.title, rec.price_int
+
+        if price_int is None:
             digits = "".join(ch for ch in (v.get("price") or "") if ch.isdigit())
             price_int = int(digits) if digits else None
 
-        photos = v.get("photos") or []
-        image_link = (photos[0] or "").strip() if photos else ""
+        image_link = rec.first_photo
         if not image_link and ALLOW_NO_PHOTO and NO_PHOTO_URL:
             image_link = NO_PHOTO_URL
 
@@ -557,7 +849,7 @@ def build_meta_vehicle_feed_csv(current: Dict[str, Any]) -> bytes:
             continue
 
         year = ""
-        m = re.search(r"\b(19\d{2}|20\d{2})\b", title)
+        m = _YEAR_RE.search(title)
         if m:
             year = m.group(1)
 
@@ -565,54 +857,95 @@ def build_meta_vehicle_feed_csv(current: Dict[str, Any]) -> bytes:
         if not brand:
             brand = title.split(" ", 1)[0].strip()
 
-        w.writerow({
-            "id": stock,
-            "title": title,
-            "description": f"{title} | Stock {stock}",
-            "availability": "in stock",
-            "condition": "used",
-            "price": f"{price_int} CAD",
-            "link": url,
-            "image_link": image_link,
-            "brand": brand,
-            "year": year,
-        })
-
-    return buf.getvalue().encode("utf-8")
+        yield (
+            stock,
+            title,
+            f"{title} | Stock {stock}",
+            "in stock",
+            "used",
+            f"{price_int} CAD",
+            url,
+            image_link,
+            brand,
+            year,
+        )
+
+def build_meta_vehicle_feed_csv(current: Dict[str, Any]) -> bytes:
+    # Encodage UTF-8 au fil de l'écriture (pas de str complet puis .encode() en copie)
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    # csv.writer (C) + writerows: la boucle d'écriture tourne dans le module csv
+    w = csv.writer(text)
+    w.writerow(META_FEED_FIELDS)
+    w.writerows(_meta_feed_rows(current))
+    text.flush()
+    return buf.getvalue()
+
+def _fb_post_delay() -> float:
+    base = max(1, SLEEP_BETWEEN)
+    usage = fb_usage_pct()
+    if usage is None:
+        return float(base)
+    if usage < FB_USAGE_THRESHOLD:
+        return float(max(1, FB_MIN_SLEEP) if FB_ADAPTIVE_SLEEP else base)
+    over = min(1.0, (usage - FB_USAGE_THRESHOLD) / max(1.0, 100.0 - FB_USAGE_THRESHOLD))
+    return base * (1.0 + 3.0 * over)
+
+def _upload_csv_with_run_copy(sb, path: str, run_path: str, data: bytes) -> None:
+    """
+    Upload CSV vers OUTPUTS_BUCKET/path puis copie côté Storage vers run_path
+    (les octets ne repassent pas sur le réseau). Fallback: 2e upload.
+    """
+    upload_bytes_to_storage(sb, OUTPUTS_BUCKET, path, data,
+                           content_type="text/csv; charset=utf-8", upsert=True)
+    try:
+        sb.storage.from_(OUTPUTS_BUCKET).copy(path, run_path)
+    except Exception:
+        upload_bytes_to_storage(sb, OUTPUTS_BUCKET, run_path, data,
+                               content_type="text/csv; charset=utf-8", upsert=True)
 
 def _site_price_quick(url: str) -> Optional[int]:
+    # Le prix est en haut du template: on lit seulement les premiers chunks (stream)
+    m = None
     try:
-        r = SESSION.get(url, timeout=25)
-        if not r.ok:
-            return None
-        txt = r.text or ""
+        with SESSION.get(url, timeout=25, stream=True) as r:
+            if not r.ok:
+                return None
+            buf = b""
+            for i, chunk in enumerate(r.iter_content(chunk_size=SITE_PRICE_CHUNK)):
+                buf += chunk
+                m = _PRICE_RE.search(buf.decode(r.encoding or "utf-8", errors="ignore"))
+                if m or i + 1 >= SITE_PRICE_MAX_CHUNKS:
+                    break
     except Exception:
         return None
-    m = re.search(r"(\d[\d\s]{2,})\s*\$", txt)
     if not m:
         return None
     digits = "".join(ch for ch in m.group(1) if ch.isdigit())
     return int(digits) if digits else None
 
 def meta_vs_site_report(current: Dict[str, Any]) -> bytes:
-    rows = []
-    n = 0
-    for _, v in current.items():
-        if n >= COMPARE_META_LIMIT:
+    targets = []
+    for v in current.values():
+        if len(targets) >= COMPARE_META_LIMIT:
             break
-        stock = (v.get("stock") or "").strip().upper()
-        url = (v.get("url") or "").strip()
-        p = v.get("price_int")
-        if not stock or not url or not isinstance(p, int):
+        rec = _canonicalize(v)
+        if not rec.stock or not rec.url or rec.price_int is None:
             continue
-        site_p = _site_price_quick(url)
+        targets.append((rec.stock, rec.url, rec.price_int))
+
+    # I/O pur: fetch des pages en parallèle (ordre conservé)
+    with ThreadPoolExecutor(max_workers=max(1, DETAIL_WORKERS)) as pool:
+        site_prices = list(pool.map(_site_price_quick, [t[1] for t in targets]))
+
+    rows = []
+    for (stock, url, p), site_p in zip(targets, site_prices):
         status = "OK"
         if site_p is None:
             status = "SITE_PRICE_MISSING"
         elif site_p != p:
             status = "PRICE_MISMATCH"
         rows.append((stock, url, p, site_p, status))
-        n += 1
 
     out = io.StringIO()
     out.write("stock,url,price_int,site_price_int,status\n")
@@ -620,7 +953,7 @@ def meta_vs_site_report(current: Dict[str, Any]) -> bytes:
         out.write(f"{stock},{url},{p},{'' if site_p is None else site_p},{status}\n")
     return out.getvalue().encode("utf-8")
 
-def refresh_no_photo_daily(sb, run_id: str, current: Dict[str, Any]) -> int:
+def refresh_no_photo_daily(sb, run_id: str, current: Dict[str, Any], events: BufferedEventLog) -> int:
     if RUN_MODE != "FULL" or not REFRESH_NO_PHOTO_DAILY:
         return 0
     if not (ALLOW_NO_PHOTO and NO_PHOTO_URL):
@@ -630,18 +963,17 @@ def refresh_no_photo_daily(sb, run_id: str, current: Dict[str, Any]) -> int:
 
     targets = []
     for slug, v in current.items():
-        photos = v.get("photos") or []
-        first = (photos[0] or "").strip() if photos else ""
-        if not first or first == NO_PHOTO_URL:
-            url = (v.get("url") or "").strip()
-            if url:
-                targets.append((slug, url))
+        rec = _canonicalize(v)
+        if (not rec.first_photo or rec.first_photo == NO_PHOTO_URL) and rec.url:
+            targets.append((slug, rec.url))
 
     targets = targets[:max(0, REFRESH_NO_PHOTO_LIMIT)]
     if not targets:
-        log_event(sb, "NO_PHOTO", "NO_PHOTO_REFRESH_NONE", {"run_id": run_id})
+        events.log("NO_PHOTO", "NO_PHOTO_REFRESH_NONE", {"run_id": run_id})
         return 0
 
+    now = utc_now_iso()
+
     fixed = 0
     for slug, url in targets:
         try:
@@ -663,24 +995,22 @@ def refresh_no_photo_daily(sb, run_id: str, current: Dict[str, Any]) -> int:
                 "price_int": fresh.get("price_int") if fresh.get("price_int") is not None else current[slug].get("price_int"),
                 "km_int": fresh.get("km_int") if fresh.get("km_int") is not None else current[slug].get("km_int"),
                 "status": "ACTIVE",
-                "updated_at": utc_now_iso(),
+                "updated_at": now,
             }])
 
             fixed += 1
         except Exception:
             continue
 
-    log_event(sb, "NO_PHOTO", "NO_PHOTO_REFRESH_DONE", {"run_id": run_id, "checked": len(targets), "fixed": fixed})
+    events.log("NO_PHOTO", "NO_PHOTO_REFRESH_DONE", {"run_id": run_id, "checked": len(targets), "fixed": fixed})
     return fixed
 
-import re
-
 CLEAN_WITHWITHOUT_DAILY = os.getenv("KENBOT_CLEAN_WITHWITHOUT_DAILY", "1").strip() == "1"
 CLEAN_WITHWITHOUT_LIMIT = int(os.getenv("KENBOT_CLEAN_WITHWITHOUT_LIMIT", "5000").strip() or "5000")
 
 _STOCK_FILE_RE = re.compile(r"^([0-9A-Z]+)_(facebook|marketplace)\.txt$", re.I)
 
-def cleanup_with_without_daily(sb, run_id: str) -> dict:
+def cleanup_with_without_daily(sb, run_id: str, events: BufferedEventLog) -> dict:
     if RUN_MODE != "FULL" or not CLEAN_WITHWITHOUT_DAILY:
         return {"skipped": "disabled_or_not_full"}
     if not _try_daily_guard(sb, "clean_withwithout"):
@@ -699,13 +1029,13 @@ def cleanup_with_without_daily(sb, run_id: str) -> dict:
 
     for prefix in ["with", "without"]:
         try:
-            items = sb.storage.from_(OUTPUTS_BUCKET).list(prefix) or []
+            # list() plafonne à 100 entrées: listing paginé
+            names = list_storage_names(sb, OUTPUTS_BUCKET, prefix)
         except Exception:
             continue
 
         to_del = []
-        for it in items:
-            name = it.get("name") or ""
+        for name in names:
             if "." not in name:
                 continue  # ignore folders like assets
             m = _STOCK_FILE_RE.match(name)
@@ -724,7 +1054,7 @@ def cleanup_with_without_daily(sb, run_id: str) -> dict:
                 sb.storage.from_(OUTPUTS_BUCKET).remove(to_del[i:i+200])
             deleted += len(to_del)
 
-    log_event(sb, "CLEAN", "WITHWITHOUT_CLEAN", {"run_id": run_id, "checked": checked, "deleted": deleted})
+    events.log("CLEAN", "WITHWITHOUT_CLEAN", {"run_id": run_id, "checked": checked, "deleted": deleted})
     return {"checked": checked, "deleted": deleted}
 
 def main() -> None:
@@ -734,18 +1064,27 @@ def main() -> None:
     now = utc_now_iso()
     run_id = _run_id_from_now(now)
 
+    # Events bufferisés (insert bulk), flush final dans le finally
+    events = BufferedEventLog(sb, cap=EVENTS_BATCH, dedupe=EVENTS_DEDUPE)
+
     try:
         upsert_scrape_run(sb, run_id, status="RUNNING", note=f"cron_prod mode={RUN_MODE}")
 
         cleanup_storage_runs(sb, RAW_BUCKET, "raw_pages", keep=RAW_KEEP)
         cleanup_storage_runs(sb, SNAP_BUCKET, "runs", keep=SNAP_KEEP)
         cleanup_storage_runs(sb, OUTPUTS_BUCKET, "runs", keep=OUTPUT_RUNS_KEEP)
+        cleanup_storage_older_than(sb, OUTPUTS_BUCKET, "text_cache", max_age_days=TEXT_CACHE_KEEP_DAYS)
 
         inv_db = get_inventory_map(sb)  # map par slug, mais values contiennent stock
-        posts_db = get_posts_map(sb)
+        posts_db = get_posts_map(sb, columns="slug,post_id,status,base_text,stock")
 
         inv_by_stock = _best_row_per_stock(list(inv_db.values()))
 
+        # Normalisation faite une fois au chargement: les boucles MISSING/SOLD/RECOVERED/PRICE
+        # lisent des attributs (slots) au lieu de .get().strip().upper() par slug
+        inv_refs = {s: InvRef.from_row(r) for s, r in inv_db.items()}
+        post_refs = {s: PostRef.from_row(p) for s, p in posts_db.items()}
+
         listing_url = f"{BASE_URL}{INVENTORY_PATH}"
         page_urls = [
             listing_url,
@@ -769,33 +1108,37 @@ def main() -> None:
 
                 detail_urls.extend(parse_inventory_listing_urls(BASE_URL, INVENTORY_PATH, html_text))
             except Exception as e:
-                log_event(sb, "SCRAPE", "LISTING_PAGE_FAIL", {"page_url": page_url, "err": str(e), "run_id": run_id})
+                events.log("SCRAPE", "LISTING_PAGE_FAIL", {"page_url": page_url, "err": str(e), "run_id": run_id})
 
         detail_urls = list(dict.fromkeys(detail_urls))
 
-        for u in detail_urls:
-            try:
-                v = parse_vehicle_detail_simple(SESSION, u)
-                stock = (v.get("stock") or "").strip().upper()
-                title = (v.get("title") or "").strip()
-                if not stock or not title:
-                    continue
-
-                existing = inv_by_stock.get(stock) or {}
-                stable_slug = (existing.get("slug") or "").strip()
-                slug = stable_slug if stable_slug else slugify(title, stock)
+        # Fetch détails en parallèle (I/O); résultats consommés dans l'ordre des URLs
+        # pour garder le même "dernier gagnant" qu'en séquentiel sur un slug dupliqué.
+        with ThreadPoolExecutor(max_workers=max(1, DETAIL_WORKERS)) as pool:
+            details = list(pool.map(_fetch_vehicle_detail, detail_urls))
 
-                v["slug"] = slug
-                current[slug] = v
-            except Exception:
+        for v in details:
+            if not v:
+                continue
+            stock = (v.get("stock") or "").strip().upper()
+            title = (v.get("title") or "").strip()
+            if not stock or not title:
                 continue
 
+            existing = inv_by_stock.get(stock) or {}
+            stable_slug = (existing.get("slug") or "").strip()
+            slug = stable_slug if stable_slug else slugify(title, stock)
+
+            v["slug"] = slug
+            current[slug] = v
+
         inv_count = len(current)
         raw_meta["inventory_count"] = inv_count
         upload_json_to_storage(sb, RAW_BUCKET, f"raw_pages/{run_id}/meta.json", raw_meta, upsert=True)
 
-        inv_db_active = {s: r for s, r in inv_db.items() if (r.get("status") or "").upper() in ("ACTIVE", "MISSING")}
-        db_active_count = len(inv_db_active) or 1
+        # Seuls les slugs servent (comptage + diffs): un set, pas une copie du dict
+        db_active_slugs = {s for s, r in inv_refs.items() if r.status in ("ACTIVE", "MISSING")}
+        db_active_count = len(db_active_slugs) or 1
 
         scrape_ok = True
         if inv_count < MIN_INVENTORY_ABS:
@@ -804,7 +1147,7 @@ def main() -> None:
             scrape_ok = False
 
         if not scrape_ok:
-            log_event(sb, "SCRAPE", "SCRAPE_TOO_SMALL", {
+            events.log("SCRAPE", "SCRAPE_TOO_SMALL", {
                 "inv_count": inv_count,
                 "db_active_count": db_active_count,
                 "min_abs": MIN_INVENTORY_ABS,
@@ -813,7 +1156,7 @@ def main() -> None:
             })
 
         if scrape_ok:
-            refresh_no_photo_daily(sb, run_id, current)
+            refresh_no_photo_daily(sb, run_id, current, events)
 
         if RUN_MODE == "FULL" and CACHE_STICKERS:
             vins = []
@@ -822,20 +1165,31 @@ def main() -> None:
                 if _is_stellantis_vin(vin):
                     vins.append(vin)
             vins = list(dict.fromkeys(vins))[:max(0, STICKER_MAX)]
-            ok = bad = skip = 0
-            for vin in vins:
+
+            # Un listing par dossier au lieu de 2 downloads "probe" par VIN,
+            # puis Storage + chrysler.com en parallèle.
+            ok_vins = _list_sticker_vins(sb, "pdf_ok")
+            bad_vins = _list_sticker_vins(sb, "pdf_bad")
+
+            def _sticker_status(vin: str) -> str:
                 try:
-                    res = ensure_sticker_cached(sb, vin, run_id)
-                    st = (res.get("status") or "").lower()
-                    if st == "ok":
-                        ok += 1
-                    elif st == "bad":
-                        bad += 1
-                    else:
-                        skip += 1
+                    res = ensure_sticker_cached(sb, vin, run_id, ok_vins, bad_vins)
+                    return (res.get("status") or "").lower()
                 except Exception:
-                    skip += 1
-            log_event(sb, "STICKER", "STICKER_SUMMARY", {"ok": ok, "bad": bad, "skip": skip, "total": len(vins), "run_id": run_id})
+                    return "skip"
+
+            with ThreadPoolExecutor(max_workers=max(1, min(STICKER_WORKERS, len(vins) or 1))) as pool:
+                statuses = list(pool.map(_sticker_status, vins))
+
+            # Résultats réutilisés par _build_ad_text (NEW / PRICE_CHANGED) dans ce run
+            _STICKER_STATUS.update(
+                (vin, st) for vin, st in zip(vins, statuses) if st in ("ok", "bad")
+            )
+
+            ok = statuses.count("ok")
+            bad = statuses.count("bad")
+            skip = len(statuses) - ok - bad
+            events.log("STICKER", "STICKER_SUMMARY", {"ok": ok, "bad": bad, "skip": skip, "total": len(vins), "run_id": run_id})
 
         # Upsert inventory ACTIVE (avec stock)
         rows = []
@@ -855,125 +1209,206 @@ def main() -> None:
         if rows:
             upsert_inventory(sb, rows)
 
-        current_slugs = set(current.keys())
-        db_slugs = set(inv_db_active.keys())
+        # Vues de clés (opérations ensemblistes sans copie). Seuls les NEW sont ordonnés:
+        # la sélection MAX_TARGETS doit rester déterministe; SOLD/RECOVERED/PRICE sont
+        # juste itérés (et comptés), l'ordre n'y change rien.
+        current_slugs = current.keys()
+        db_slugs = db_active_slugs
 
-        disappeared_slugs = sorted(db_slugs - current_slugs)
-        new_slugs = sorted(current_slugs - db_slugs)
-        common_slugs = sorted(current_slugs & db_slugs)
+        disappeared_slugs = db_slugs - current_slugs
+        new_slugs = current_slugs - db_slugs
+        common_slugs = current_slugs & db_slugs
 
         if scrape_ok:
-            daily_stats = daily_audit_and_fix(sb, run_id)
-            log_event(sb, "DAILY", "DAILY_FIX", {"run_id": run_id, **daily_stats})
+            daily_stats = daily_audit_and_fix(sb, run_id, events)
+            events.log("DAILY", "DAILY_FIX", {"run_id": run_id, **daily_stats})
 
-            ww = cleanup_with_without_daily(sb, run_id)
-            log_event(sb, "CLEAN", "WITHWITHOUT_CLEAN_RESULT", {"run_id": run_id, **ww})
+            ww = cleanup_with_without_daily(sb, run_id, events)
+            events.log("CLEAN", "WITHWITHOUT_CLEAN_RESULT", {"run_id": run_id, **ww})
 
-        # Recovered MISSING -> ACTIVE (inclut stock si possible)
+        # Recovered MISSING -> ACTIVE (inclut stock si possible), 1 upsert bulk
+        recovered_rows = []
         for slug in common_slugs:
-            old = inv_db.get(slug) or {}
-            if (old.get("status") or "").upper() == "MISSING":
-                st = (old.get("stock") or "").strip().upper()
+            old = inv_refs[slug]
+            if old.status == "MISSING":
+                st = old.stock
                 payload = {"slug": slug, "status": "ACTIVE", "updated_at": now, "last_seen": now}
                 if st:
                     payload["stock"] = st
-                upsert_inventory(sb, [payload])
-                log_event(sb, slug, "RECOVERED_ACTIVE", {"run_id": run_id})
+                recovered_rows.append(payload)
+        if recovered_rows:
+            upsert_inventory(sb, recovered_rows)
+            for payload in recovered_rows:
+                events.log(payload["slug"], "RECOVERED_ACTIVE", {"run_id": run_id})
 
         # SOLD flow fiable
         if scrape_ok:
+            # Statuts inventory + posts SOLD accumulés, écrits en bulk après la boucle.
+            # Edits FB (post_id, message) envoyés via Graph ?batch= après la boucle;
+            # l'inventory ne passe SOLD qu'une fois l'edit confirmé (sinon reste MISSING
+            # et le prochain run réessaie).
+            status_rows: List[Dict[str, Any]] = []
+            sold_post_rows: List[Dict[str, Any]] = []
+            sold_edits: List[Tuple[str, str, str, Dict[str, Any], Dict[str, Any]]] = []
+
+            # Posts à marquer SOLD sans base_text en DB (legacy): messages FB lus en
+            # Graph ?batch= d'avance au lieu d'un GET par post dans la boucle
+            need_msg = [
+                post_refs[s].post_id for s in disappeared_slugs
+                if inv_refs[s].status == "MISSING" and s in post_refs
+                and post_refs[s].post_id and post_refs[s].status != "SOLD"
+                and not post_refs[s].base_text
+            ]
+            prefetched_msgs = fetch_posts_messages_batch(need_msg, FB_TOKEN) if (need_msg and not DRY_RUN) else {}
             for slug in disappeared_slugs:
-                old_inv = inv_db.get(slug) or {}
-                old_status = (old_inv.get("status") or "").upper()
-                st = (old_inv.get("stock") or "").strip().upper()
+                old = inv_refs[slug]
+                old_status = old.status
+                st = old.stock
 
-                post = posts_db.get(slug) or {}
-                post_id = post.get("post_id")
+                post = post_refs.get(slug, _NO_POST)
+                post_id = post.post_id
 
                 if old_status == "ACTIVE":
                     payload = {"slug": slug, "status": "MISSING", "updated_at": now}
                     if st:
                         payload["stock"] = st
-                    upsert_inventory(sb, [payload])
-                    log_event(sb, slug, "MISSING_1", {"post_id": post_id, "run_id": run_id})
+                    status_rows.append(payload)
+                    events.log(slug, "MISSING_1", {"post_id": post_id, "run_id": run_id})
                     continue
 
                 if old_status == "MISSING":
-                    if post_id and str(post.get("status", "")).upper() != "SOLD":
+                    payload = {"slug": slug, "status": "SOLD", "updated_at": now}
+                    if st:
+                        payload["stock"] = st
+
+                    if post_id and post.status != "SOLD":
                         if DRY_RUN:
                             print(f"DRY_RUN: would MARK SOLD -> {slug} (post_id={post_id})", flush=True)
                         else:
                             try:
-                                base_text = (post.get("base_text") or "").strip()
+                                base_text = post.base_text
                                 if not base_text:
-                                    from fb_api import fetch_fb_post_message
-                                    base_text = _strip_sold_banner(fetch_fb_post_message(post_id, FB_TOKEN))
+                                    fb_msg = prefetched_msgs.get(post_id)
+                                    if fb_msg is None:
+                                        fb_msg = fetch_fb_post_message(post_id, FB_TOKEN)
+                                    base_text = _strip_sold_banner(fb_msg)
                                 msg = _make_sold_message(base_text)
-                                update_post_text(post_id, FB_TOKEN, msg)
-
-                                upsert_post(sb, {
+                                sold_edits.append((slug, post_id, msg, {
                                     "slug": slug,
                                     "post_id": post_id,
                                     "status": "SOLD",
                                     "sold_at": now,
                                     "last_updated_at": now,
                                     "base_text": base_text,
-                                    "stock": post.get("stock") or st,
-                                })
-                                log_event(sb, slug, "SOLD_CONFIRMED", {"post_id": post_id, "run_id": run_id})
+                                    "stock": post.stock or st,
+                                }, payload))
                             except Exception as e:
-                                log_event(sb, slug, "FB_SOLD_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
+                                events.log(slug, "FB_SOLD_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
+                            continue
+
+                    status_rows.append(payload)
+
+            if sold_edits:
+                errors = update_posts_text_batch([(pid, msg) for _, pid, msg, _, _ in sold_edits], FB_TOKEN)
+                for (slug, post_id, _, row, inv_row), err in zip(sold_edits, errors):
+                    if err is None:
+                        sold_post_rows.append(row)
+                        status_rows.append(inv_row)
+                        events.log(slug, "SOLD_CONFIRMED", {"post_id": post_id, "run_id": run_id})
+                    else:
+                        events.log(slug, "FB_SOLD_FAIL", {"post_id": post_id, "err": err, "run_id": run_id})
 
-                    payload = {"slug": slug, "status": "SOLD", "updated_at": now}
-                    if st:
-                        payload["stock"] = st
-                    upsert_inventory(sb, [payload])
+            if sold_post_rows:
+                upsert_posts(sb, sold_post_rows)
+            if status_rows:
+                upsert_inventory(sb, status_rows)
         else:
             if disappeared_slugs:
-                log_event(sb, "SCRAPE", "SKIP_SOLD_DUE_TO_BAD_SCRAPE", {"count": len(disappeared_slugs), "run_id": run_id})
+                events.log("SCRAPE", "SKIP_SOLD_DUE_TO_BAD_SCRAPE", {"count": len(disappeared_slugs), "run_id": run_id})
 
-        # PRICE_CHANGED
+        # PRICE_CHANGED (edits FB groupés via Graph ?batch= après la boucle)
         if scrape_ok:
-            for slug in common_slugs:
-                old = inv_db.get(slug) or {}
-                new = current.get(slug) or {}
-                if old.get("price_int") is None or new.get("price_int") is None:
-                    continue
-                if old.get("price_int") == new.get("price_int"):
-                    continue
-
-                post = posts_db.get(slug) or {}
-                post_id = post.get("post_id")
-                if not post_id:
-                    continue
-                if (post.get("status") or "").upper() == "SOLD":
-                    continue
-
-                if DRY_RUN:
-                    print(f"DRY_RUN: would UPDATE PRICE text -> {slug} ({old.get('price_int')} -> {new.get('price_int')})", flush=True)
-                    continue
+            price_edits: List[Tuple[str, str, str, Dict[str, Any]]] = []
+            # Candidats filtrés en amont (prix changé, post actif existant): le corps
+            # de boucle ne tourne que pour les slugs qui ont vraiment du travail.
+            def _price_candidates():
+                for slug in common_slugs:
+                    old_p = inv_refs[slug].price_int
+                    new_p = current[slug].get("price_int")
+                    if old_p is None or new_p is None or old_p == new_p:
+                        continue
+                    post = post_refs.get(slug, _NO_POST)
+                    post_id = post.post_id
+                    if not post_id or post.status == "SOLD":
+                        continue
+                    yield slug, old_p, new_p, post_id
+
+            candidates = list(_price_candidates())
+            if DRY_RUN:
+                for slug, old_p, new_p, _ in candidates:
+                    print(f"DRY_RUN: would UPDATE PRICE text -> {slug} ({old_p} -> {new_p})", flush=True)
+                candidates = []
 
+            def _price_text(c) -> Tuple[Optional[str], Optional[str]]:
                 try:
-                    msg = _build_ad_text(sb, run_id, slug, new, event="PRICE_CHANGED")
-                    update_post_text(post_id, FB_TOKEN, msg)
-                    upsert_post(sb, {
-                        "slug": slug,
-                        "post_id": post_id,
-                        "status": "ACTIVE",
-                        "last_updated_at": now,
-                        "base_text": _strip_sold_banner(msg),
-                        "stock": new.get("stock"),
-                    })
-                    log_event(sb, slug, "PRICE_CHANGED_UPDATED", {"post_id": post_id, "run_id": run_id})
+                    return _build_ad_text(sb, run_id, c[0], current[c[0]], event="PRICE_CHANGED"), None
                 except Exception as e:
-                    log_event(sb, slug, "FB_PRICE_UPDATE_FAIL", {"post_id": post_id, "err": str(e), "run_id": run_id})
+                    return None, str(e)
+
+            # Textes (sticker + text-engine, I/O pur) générés en parallèle; ordre conservé
+            texts: List[Tuple[Optional[str], Optional[str]]] = []
+            if candidates:
+                with ThreadPoolExecutor(max_workers=max(1, min(TEXT_WORKERS, len(candidates)))) as pool:
+                    texts = list(pool.map(_price_text, candidates))
+
+            for (slug, _, _, post_id), (msg, err) in zip(candidates, texts):
+                if err is not None:
+                    events.log(slug, "FB_PRICE_UPDATE_FAIL", {"post_id": post_id, "err": err, "run_id": run_id})
+                    continue
+                price_edits.append((slug, post_id, msg, {
+                    "slug": slug,
+                    "post_id": post_id,
+                    "status": "ACTIVE",
+                    "last_updated_at": now,
+                    "base_text": _strip_sold_banner(msg),
+                    "stock": current[slug].get("stock"),
+                }))
+
+            if price_edits:
+                errors = update_posts_text_batch([(pid, msg) for _, pid, msg, _ in price_edits], FB_TOKEN)
+                price_post_rows = []
+                for (slug, post_id, _, row), err in zip(price_edits, errors):
+                    if err is None:
+                        price_post_rows.append(row)
+                        events.log(slug, "PRICE_CHANGED_UPDATED", {"post_id": post_id, "run_id": run_id})
+                    else:
+                        events.log(slug, "FB_PRICE_UPDATE_FAIL", {"post_id": post_id, "err": err, "run_id": run_id})
+                if price_post_rows:
+                    upsert_posts(sb, price_post_rows)
 
         # NEW posts
         posted = 0
-        for slug in new_slugs[:max(0, MAX_TARGETS)]:
+        # == sorted(new_slugs)[:MAX_TARGETS] sans trier tous les NEW (O(N log k))
+        new_targets = heapq.nsmallest(max(0, MAX_TARGETS), new_slugs)
+
+        # Photos des NEW téléchargées en arrière-plan (1 véhicule à la fois, photos en
+        # parallèle dans _download_photos): elles avancent pendant le text-engine,
+        # la création FB et le SLEEP_BETWEEN du véhicule précédent.
+        photo_pool = ThreadPoolExecutor(max_workers=1)
+        photo_futs = {}
+        if not DRY_RUN:
+            for slug in new_targets:
+                v = current.get(slug) or {}
+                photo_futs[slug] = photo_pool.submit(
+                    _download_photos,
+                    (v.get("stock") or "").strip().upper(),
+                    v.get("photos") or [],
+                    MAX_PHOTOS,
+                )
+
+        for i, slug in enumerate(new_targets, start=1):
             v = current.get(slug) or {}
             stock = (v.get("stock") or "").strip().upper()
-            photos = v.get("photos") or []
 
             if DRY_RUN:
                 print(f"DRY_RUN: would POST NEW -> {slug} ({stock})", flush=True)
@@ -983,9 +1418,9 @@ def main() -> None:
             try:
                 msg = _build_ad_text(sb, run_id, slug, v, event="NEW")
 
-                photo_paths = _download_photos(stock, photos, limit=MAX_PHOTOS)
+                photo_paths = photo_futs[slug].result()
                 if not photo_paths:
-                    log_event(sb, slug, "NEW_SKIP_NO_PHOTOS", {"run_id": run_id})
+                    events.log(slug, "NEW_SKIP_NO_PHOTOS", {"run_id": run_id})
                     continue
 
                 media_ids = publish_photos_unpublished(FB_PAGE_ID, FB_TOKEN, photo_paths[:POST_PHOTOS], limit=POST_PHOTOS)
@@ -1007,34 +1442,33 @@ def main() -> None:
                     "base_text": _strip_sold_banner(msg),
                     "stock": stock,
                 })
-                log_event(sb, slug, "NEW_POSTED", {"post_id": post_id, "stock": stock, "run_id": run_id})
+                events.log(slug, "NEW_POSTED", {"post_id": post_id, "stock": stock, "run_id": run_id})
 
                 posted += 1
-                time.sleep(max(1, SLEEP_BETWEEN))
+                if i < len(new_targets):  # pas de pause après le dernier post
+                    time.sleep(_fb_post_delay())
             except Exception as e:
-                log_event(sb, slug, "FB_NEW_FAIL", {"err": str(e), "run_id": run_id})
+                events.log(slug, "FB_NEW_FAIL", {"err": str(e), "run_id": run_id})
+        photo_pool.shutdown(wait=True)
 
         # Meta feed + report (FULL only)
         if RUN_MODE == "FULL" and BUILD_META_FEEDS:
             feed_bytes = build_meta_vehicle_feed_csv(current)
-            upload_bytes_to_storage(sb, OUTPUTS_BUCKET, "feeds/meta_vehicle.csv", feed_bytes,
-                                   content_type="text/csv; charset=utf-8", upsert=True)
-            upload_bytes_to_storage(sb, OUTPUTS_BUCKET, f"runs/{run_id}/feeds/meta_vehicle.csv", feed_bytes,
-                                   content_type="text/csv; charset=utf-8", upsert=True)
-            log_event(sb, "META", "META_FEED_UPLOADED", {"run_id": run_id, "rows": len(current)})
+            _upload_csv_with_run_copy(sb, "feeds/meta_vehicle.csv", f"runs/{run_id}/feeds/meta_vehicle.csv", feed_bytes)
+            events.log("META", "META_FEED_UPLOADED", {"run_id": run_id, "rows": len(current)})
 
         if RUN_MODE == "FULL" and COMPARE_META_VS_SITE:
             report_bytes = meta_vs_site_report(current)
-            upload_bytes_to_storage(sb, OUTPUTS_BUCKET, "reports/meta_vs_site.csv", report_bytes,
-                                   content_type="text/csv; charset=utf-8", upsert=True)
-            upload_bytes_to_storage(sb, OUTPUTS_BUCKET, f"runs/{run_id}/reports/meta_vs_site.csv", report_bytes,
-                                   content_type="text/csv; charset=utf-8", upsert=True)
+            _upload_csv_with_run_copy(sb, "reports/meta_vs_site.csv", f"runs/{run_id}/reports/meta_vs_site.csv", report_bytes)
 
         upsert_scrape_run(sb, run_id, status="OK", note=f"cron_prod mode={RUN_MODE} posted={posted} inv={inv_count}")
         print(f"✅ cron_prod done run_id={run_id} mode={RUN_MODE} inv={inv_count} new_posted={posted} scrape_ok={scrape_ok}", flush=True)
 
     finally:
-        release_lock(sb)
+        try:
+            events.flush()
+        finally:
+            release_lock(sb)
 
 
 if __name__ == "__main__":
@@ -17,17 +17,22 @@ sticker_to_ad.py
 from __future__ import annotations
 
 import argparse
+import hashlib
+import io
+import json
+import os
 import re
 import sys
 import tempfile
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, BinaryIO, Union
 
 # ---------- PDF text extraction (pdfminer) ----------
 from pdfminer.high_level import extract_pages
 from pdfminer.high_level import extract_text as pdfminer_extract_text
-from pdfminer.layout import LTTextContainer, LTChar, LTAnno
+from pdfminer.layout import LAParams, LTTextContainer, LTChar, LTAnno
 
 # ---------- Optional: decrypt PDFs ----------
 try:
@@ -35,6 +40,12 @@ try:
 except Exception:
     pikepdf = None
 
+# ---------- Optional: PyMuPDF (extraction spans rapide, C) ----------
+try:
+    import pymupdf  # type: ignore
+except Exception:
+    pymupdf = None
+
 # ---------- OCR fallback ----------
 try:
     import pytesseract  # type: ignore
@@ -58,110 +69,140 @@ class Span:
     bold_ratio: float  # 0..1
 
 
+# ------------------------------
+# Regex (compilées une fois: appelées pour chaque span / ligne)
+# ------------------------------
+
+_RE_WS = re.compile(r"\s+")
+_RE_WS2 = re.compile(r"\s{2,}")
+_RE_PRICE_TOKEN = re.compile(r"(\$\s*)?\b\d[\d\s.,]*\b\s*\$?")
+# capture 595, 2,395, 2 395, 2,395.00 etc.
+_RE_PRICE = re.compile(r"(?i)(?:\$\s*)?(\d{1,3}(?:[,\s]\d{3})*(?:[.,]\d{2})?)\s*\$?")
+_RE_PRICE_ONLY = re.compile(r"(?i)^\s*(?:\$\s*)?(\d{1,3}(?:[,\s]\d{3})*(?:[.,]\d{2})?)\s*\$?\s*$")
+_RE_VIN17 = re.compile(r"\b([A-HJ-NPR-Z0-9]{17})\b")
+_RE_VIN17_FULL = re.compile(r"[A-HJ-NPR-Z0-9]{17}")
+_RE_VIN_PARTS = re.compile(
+    r"\b([A-HJ-NPR-Z0-9]{3,6})\s*[-–—]\s*([A-HJ-NPR-Z0-9]{4,8})\s*[-–—]\s*([A-HJ-NPR-Z0-9]{3,8})\b"
+)
+_RE_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+_RE_IOQ = re.compile(r"[IOQ]")
+_RE_NON_VIN = re.compile(r"[^A-Z0-9\-–—\s]")
+_RE_VIN_SEP = re.compile(r"[\s\-–—]")
+_RE_NON_LETTERS = re.compile(r"[^A-Za-zÀ-ÿ]")
+_RE_WWW = re.compile(r"\bwww\.[^\s]+", re.I)
+_RE_DIGITS_DASHES = re.compile(r"[\d\s\-–—]+")
+
+def _phrases_re(phrases) -> "re.Pattern[str]":
+    """
+    Une seule regex (alternance) pour « contient une de ces phrases »:
+    un passage en C au lieu d'un `in` Python par phrase.
+    """
+    uniq = sorted(set(phrases), key=len, reverse=True)
+    return re.compile("|".join(re.escape(x) for x in uniq))
+
+
+# apostrophes / tirets typographiques + nbsp -> ASCII (looks_like_junk)
+_JUNK_TBL = str.maketrans({"’": "'", "−": "-", "–": "-", "\u00a0": " "})
+
+
 # ------------------------------
 # Helpers
 # ------------------------------
 
 def normalize(s: str) -> str:
     s = (s or "").replace("\xa0", " ")
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _RE_WS.sub(" ", s).strip()
     return s
 
 
 def is_price_token(s: str) -> bool:
     s = normalize(s)
     # accepte $ collé, après, etc.
-    return bool(re.search(r"(\$\s*)?\b\d[\d\s.,]*\b\s*\$?", s))
+    return bool(_RE_PRICE_TOKEN.search(s))
 
 
 def extract_price(s: str) -> Optional[str]:
     s = normalize(s)
     # capture 595, 2,395, 2 395, 2,395.00 etc.
-    m = re.search(r"(?i)(?:\$\s*)?(\d{1,3}(?:[,\s]\d{3})*(?:[.,]\d{2})?)\s*\$?", s)
+    m = _RE_PRICE.search(s)
     if not m:
         return None
     raw = normalize(m.group(1)).replace(" ", "")
     return f"{raw} $" if raw else None
 
 
-def looks_like_junk(s: str) -> bool:
-    if not s:
-        return True
-
-    low = s.lower()
-    low = (low
-       .replace("’", "'")
-       .replace("−", "-")
-       .replace("–", "-")
-       .replace("\u00a0", " ")
+_JUNK_PHRASES = (
+    "année modèle",
+    "annee modele",
+    "prix de base",
+    "prix total",
+    "p.d.s.f",
+    "pdsf",
+    "préparation",
+    "preparation",
+    "frais d'expédition",
+    "frais d expedition",
+    "destination",
+    "destination charge",
+    "freight",
+    "shipping",
+    "energuide",
+    "consommation",
+    "annual fuel cost",
+    "coût annuel",
+    "cout annuel",
+    "garantie",
+    "assistance routière",
+    "assistance routiere",
+    "transférable",
+    "transferable",
+    "motopropulseur",
+    "fca canada",
+    "ce véhicule est fabriqué",
+    "ce vehicule est fabrique",
+    "vehicles.nrcan",
+    "vehicules.nrcan",
+    "indice",
+    "smog",
+    "carbon",
+    "tailpipe",
+    "government of canada",
+    "visitez le site web",
+    "contactez",
+    "pour de plus amples renseignements",
+    "manufacturer's suggested retail price",
+    "suggested retail price",
+    "msrp",
+    "tariff adjustment",
+    "total price",
+    "base price",
+    "destination charge",
+    "freight charge",
+    "destination charge",
+    "tariff adjustment",
+    "federal a/c excise tax",
+    "frais d’expédition",
+    "taxe d’accise",
+    "taxe d'accise",
+    "federal a c excise tax",  # OCR parfois enlève le slash)
 )
+_RE_JUNK = _phrases_re(_JUNK_PHRASES)
 
-    banned = (
-        "année modèle",
-        "annee modele",
-        "prix de base",
-        "prix total",
-        "p.d.s.f",
-        "pdsf",
-        "préparation",
-        "preparation",
-        "frais d'expédition",
-        "frais d expedition",
-        "destination",
-        "destination charge",
-        "freight",
-        "shipping",
-        "energuide",
-        "consommation",
-        "annual fuel cost",
-        "coût annuel",
-        "cout annuel",
-        "garantie",
-        "assistance routière",
-        "assistance routiere",
-        "transférable",
-        "transferable",
-        "motopropulseur",
-        "fca canada",
-        "ce véhicule est fabriqué",
-        "ce vehicule est fabrique",
-        "vehicles.nrcan",
-        "vehicules.nrcan",
-        "indice",
-        "smog",
-        "carbon",
-        "tailpipe",
-        "government of canada",
-        "visitez le site web",
-        "contactez",
-        "pour de plus amples renseignements",
-        "manufacturer's suggested retail price",
-        "suggested retail price",
-        "msrp",
-        "tariff adjustment",
-        "total price",
-        "base price",
-        "destination charge",
-        "freight charge",
-        "destination charge",
-        "tariff adjustment",
-        "federal a/c excise tax",
-        "frais d’expédition",
-        "taxe d’accise",
-        "taxe d'accise",
-        "federal a c excise tax",  # OCR parfois enlève le slash)
-    )
-    if any(b in low for b in banned):
-        return True
 
-    if "http" in low or "www." in low:
+def looks_like_junk(s: str) -> bool:
+    if not s:
         return True
 
     # trop long = souvent paragraphe
     if len(s) > 90:
         return True
 
-    return False
+    low = s.lower().translate(_JUNK_TBL)
+
+    if "http" in low or "www." in low:
+        return True
+
+    return bool(_RE_JUNK.search(low))
 
 
 def detect_hybrid_from_text(txt: str) -> bool:
@@ -183,6 +224,24 @@ def detect_hybrid_from_text(txt: str) -> bool:
     ))
 
 
+_HARD_STOP_PHRASES = (
+    # FR
+    "le concessionnaire",
+    "peut vendre moins cher",
+    "expedier a", "expédier à",
+    "expedie a", "expédié à",
+    "vendu a", "vendu à",
+    "par le concessionnaire",
+    # EN
+    "the dealer",
+    "may sell for less",
+    "shipped to",
+    "sold to",
+    "by dealer",
+)
+_RE_HARD_STOP = _phrases_re(_HARD_STOP_PHRASES)
+
+
 def is_hard_stop_detail(t: str) -> bool:
     """
     Stop net quand on arrive dans le bas du sticker (dealer/shipped/sold).
@@ -190,26 +249,10 @@ def is_hard_stop_detail(t: str) -> bool:
     """
     low = (t or "").lower().strip()
 
-    stop_phrases = (
-        # FR
-        "le concessionnaire",
-        "peut vendre moins cher",
-        "expedier a", "expédier à",
-        "expedie a", "expédié à",
-        "vendu a", "vendu à",
-        "par le concessionnaire",
-        # EN
-        "the dealer",
-        "may sell for less",
-        "shipped to",
-        "sold to",
-        "by dealer",
-    )
-
     if low == "s.l.":
         return True
 
-    return any(k in low for k in stop_phrases)
+    return bool(_RE_HARD_STOP.search(low))
 
 
 def extract_vin_from_text(txt: str) -> str:
@@ -222,27 +265,24 @@ def extract_vin_from_text(txt: str) -> str:
 
     t = (txt or "").upper()
 
-    m = re.search(r"\b([A-HJ-NPR-Z0-9]{17})\b", t)
+    m = _RE_VIN17.search(t)
     if m:
         return m.group(1)
 
-    m2 = re.search(
-        r"\b([A-HJ-NPR-Z0-9]{3,6})\s*[-–—]\s*([A-HJ-NPR-Z0-9]{4,8})\s*[-–—]\s*([A-HJ-NPR-Z0-9]{3,8})\b",
-        t,
-    )
+    m2 = _RE_VIN_PARTS.search(t)
     if m2:
         cand = (m2.group(1) + m2.group(2) + m2.group(3))
-        cand = re.sub(r"[^A-Z0-9]", "", cand)
-        if len(cand) == 17 and not re.search(r"[IOQ]", cand):
+        cand = _RE_NON_ALNUM.sub("", cand)
+        if len(cand) == 17 and not _RE_IOQ.search(cand):
             return cand
 
-    blob = re.sub(r"[^A-Z0-9\-–—\s]", " ", t)
-    blob = re.sub(r"\s+", " ", blob).strip()
-    compact = re.sub(r"[\s\-–—]", "", blob)
+    blob = _RE_NON_VIN.sub(" ", t)
+    blob = _RE_WS.sub(" ", blob).strip()
+    compact = _RE_VIN_SEP.sub("", blob)
 
     for i in range(0, max(0, len(compact) - 16)):
         win = compact[i: i + 17]
-        if re.fullmatch(r"[A-HJ-NPR-Z0-9]{17}", win) and not re.search(r"[IOQ]", win):
+        if _RE_VIN17_FULL.fullmatch(win) and not _RE_IOQ.search(win):
             return win
 
     return ""
@@ -250,8 +290,8 @@ def extract_vin_from_text(txt: str) -> str:
 
 def clean_option_line(s: str) -> str:
     s = normalize(s)
-    s = re.sub(r"\bwww\.[^\s]+", "", s, flags=re.I).strip()
-    s = re.sub(r"\s{2,}", " ", s).strip()
+    s = _RE_WWW.sub("", s).strip()
+    s = _RE_WS2.sub(" ", s).strip()
     return s
 
 
@@ -360,9 +400,159 @@ def maybe_decrypt_pdf(in_pdf: Path) -> Path:
 # PDF miner spans extraction
 # ------------------------------
 
-def extract_spans_pdfminer(pdf_path: Path, max_pages: int = 2) -> List[Span]:
+# Layout pdfminer sans boxes_flow: saute le regroupement hiérarchique des text boxes
+# (étape quadratique). Les lignes/coords restent identiques; seul l'ordre des boxes
+# change, et tous les consommateurs de spans re-trient par coordonnées.
+SPANS_LAPARAMS = LAParams(boxes_flow=None)
+
+# ---------- Cache disque des parses pdfminer (clé = sha256 des bytes du PDF) ----------
+# Même sticker = même parse: on saute pdfminer (layout Python, lent) au 2e passage.
+# JSON plutôt que pickle: le dossier est dans /tmp (partagé), rien d'exécutable.
+SPANS_CACHE = os.getenv("KENBOT_SPANS_CACHE", "1").strip() == "1"
+SPANS_CACHE_DIR = Path(
+    os.getenv("KENBOT_SPANS_CACHE_DIR", "").strip()
+    or (Path(tempfile.gettempdir()) / "sticker_spans_cache")
+)
+# Éviction (au 1er write du process): entrées non lues depuis N jours, puis les plus
+# anciennes au-delà du plafond d'entrées. 0 = pas de limite.
+SPANS_CACHE_MAX_AGE_DAYS = int(os.getenv("KENBOT_SPANS_CACHE_MAX_AGE_DAYS", "30").strip() or "30")
+SPANS_CACHE_MAX_ENTRIES = int(os.getenv("KENBOT_SPANS_CACHE_MAX_ENTRIES", "2000").strip() or "2000")
+_SPANS_CACHE_VERSION = "v1"  # à incrémenter si le parsing change
+_spans_cache_pruned = False
+
+
+def _pdf_cache_key(kind: str, data: bytes, max_pages: int) -> str:
+    h = hashlib.sha256(f"{_SPANS_CACHE_VERSION}|{kind}|{max_pages}|".encode("utf-8"))
+    h.update(data)
+    return h.hexdigest()
+
+
+def _spans_cache_get(key: str) -> Any:
+    path = SPANS_CACHE_DIR / f"{key}.json"
+    try:
+        value = json.loads(path.read_bytes())
+    except Exception:
+        return None
+    try:
+        os.utime(path)  # mtime = dernier accès: l'éviction garde les stickers encore lus
+    except OSError:
+        pass
+    return value
+
+
+def _spans_cache_prune() -> None:
+    """Supprime les entrées trop vieilles (mtime) puis les plus anciennes au-delà du plafond."""
+    cutoff = time.time() - SPANS_CACHE_MAX_AGE_DAYS * 86400 if SPANS_CACHE_MAX_AGE_DAYS > 0 else None
+    entries: List[Tuple[float, Path]] = []
+    for path in SPANS_CACHE_DIR.iterdir():
+        if path.suffix not in (".json", ".tmp"):
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue
+        if (cutoff is not None and mtime < cutoff) or (path.suffix == ".tmp" and mtime < time.time() - 3600):
+            path.unlink(missing_ok=True)
+        elif path.suffix == ".json":
+            entries.append((mtime, path))
+
+    if SPANS_CACHE_MAX_ENTRIES > 0 and len(entries) > SPANS_CACHE_MAX_ENTRIES:
+        entries.sort()
+        for _, path in entries[:len(entries) - SPANS_CACHE_MAX_ENTRIES]:
+            path.unlink(missing_ok=True)
+
+
+def _spans_cache_put(key: str, value: Any) -> None:
+    global _spans_cache_pruned
+    tmp_name = None
+    try:
+        SPANS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if not _spans_cache_pruned:
+            _spans_cache_pruned = True
+            try:
+                _spans_cache_prune()
+            except Exception:
+                pass
+        # Fichier temporaire unique (process ET thread), puis rename atomique:
+        # jamais de fichier à moitié écrit, même avec des parses en parallèle.
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=SPANS_CACHE_DIR, prefix=f"{key}.", suffix=".tmp", delete=False
+        ) as f:
+            tmp_name = f.name
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_name, SPANS_CACHE_DIR / f"{key}.json")
+        tmp_name = None
+    except Exception:
+        pass
+    finally:
+        if tmp_name:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+
+
+def _read_pdf_bytes(pdf_path: Union[Path, BinaryIO]) -> bytes:
+    if hasattr(pdf_path, "read"):
+        pos = pdf_path.tell()
+        data = pdf_path.read()
+        pdf_path.seek(pos)
+        return data
+    return Path(pdf_path).read_bytes()
+
+
+def extract_spans_pdfminer(
+    pdf_path: Union[Path, BinaryIO],
+    max_pages: int = 2,
+    laparams: Optional[LAParams] = None,
+) -> List[Span]:
+    """
+    pdf_path: chemin OU objet fichier binaire (ex: io.BytesIO des bytes du PDF,
+    pour parser en mémoire sans passer par /tmp).
+    laparams: None => SPANS_LAPARAMS (seul cas mis en cache disque, voir SPANS_CACHE).
+    """
+    if not SPANS_CACHE or laparams is not None:
+        return _parse_spans_pdfminer(pdf_path, max_pages, laparams)
+
+    data = _read_pdf_bytes(pdf_path)
+    key = _pdf_cache_key("spans", data, max_pages)
+    cached = _spans_cache_get(key)
+    if isinstance(cached, list):
+        try:
+            return [Span(*row) for row in cached]
+        except Exception:
+            pass
+
+    spans = _parse_spans_pdfminer(io.BytesIO(data), max_pages, None)
+    _spans_cache_put(key, [[sp.text, sp.x0, sp.y0, sp.x1, sp.y1, sp.bold_ratio] for sp in spans])
+    return spans
+
+
+def extract_text_pdfminer(pdf_path: Union[Path, BinaryIO], max_pages: int = 2) -> str:
+    """pdfminer extract_text (texte brut), même cache disque que les spans."""
+    if not SPANS_CACHE:
+        src = pdf_path if hasattr(pdf_path, "read") else str(pdf_path)
+        return pdfminer_extract_text(src, maxpages=max_pages) or ""
+
+    data = _read_pdf_bytes(pdf_path)
+    key = _pdf_cache_key("text", data, max_pages)
+    cached = _spans_cache_get(key)
+    if isinstance(cached, str):
+        return cached
+
+    txt = pdfminer_extract_text(io.BytesIO(data), maxpages=max_pages) or ""
+    _spans_cache_put(key, txt)
+    return txt
+
+
+def _parse_spans_pdfminer(
+    pdf_path: Union[Path, BinaryIO],
+    max_pages: int,
+    laparams: Optional[LAParams],
+) -> List[Span]:
     spans: List[Span] = []
     pages = 0
+    src = pdf_path if hasattr(pdf_path, "read") else str(pdf_path)
 
     def iter_objs(obj):
         if isinstance(obj, (LTChar, LTAnno)):
@@ -374,7 +564,7 @@ def extract_spans_pdfminer(pdf_path: Path, max_pages: int = 2) -> List[Span]:
         except TypeError:
             yield obj
 
-    for page_layout in extract_pages(str(pdf_path)):
+    for page_layout in extract_pages(src, maxpages=max_pages, laparams=laparams or SPANS_LAPARAMS):
         pages += 1
 
         for element in page_layout:
@@ -426,10 +616,76 @@ def extract_spans_pdfminer(pdf_path: Path, max_pages: int = 2) -> List[Span]:
     return spans
 
 
+# ------------------------------
+# PyMuPDF spans extraction (optionnel)
+# ------------------------------
+
+_BOLD_FONT_KEYS = ("bold", "black", "demi", "heavy", "semibold")
+
+def extract_spans_pymupdf(pdf_bytes: bytes, max_pages: int = 2) -> List[Span]:
+    """
+    Même sortie que extract_spans_pdfminer (1 Span par ligne de texte, coords pdfminer:
+    origine en bas à gauche), via PyMuPDF. [] si PyMuPDF absent ou PDF illisible.
+    """
+    if pymupdf is None or not pdf_bytes:
+        return []
+
+    spans: List[Span] = []
+    try:
+        doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+    except Exception:
+        return []
+
+    with doc:
+        for page_no, page in enumerate(doc):
+            if page_no >= max_pages:
+                break
+            height = page.rect.height
+            for block in page.get_text("dict").get("blocks", []):
+                for line in block.get("lines", []):
+                    parts = line.get("spans", [])
+                    text = normalize("".join(sp.get("text", "") for sp in parts))
+                    if not text:
+                        continue
+
+                    n_chars = bold = 0
+                    for sp in parts:
+                        n = len((sp.get("text") or "").strip())
+                        n_chars += n
+                        font = (sp.get("font") or "").lower()
+                        if any(k in font for k in _BOLD_FONT_KEYS):
+                            bold += n
+
+                    x0, top, x1, bottom = line.get("bbox", (0.0, 0.0, 0.0, 0.0))
+                    spans.append(
+                        Span(
+                            text=text,
+                            x0=float(x0),
+                            y0=float(height - bottom),
+                            x1=float(x1),
+                            y1=float(height - top),
+                            bold_ratio=(bold / n_chars) if n_chars else 0.0,
+                        )
+                    )
+
+    return spans
+
+
 # ------------------------------
 # Big title extraction (best effort)
 # ------------------------------
 
+_TITLE_BAD_PHRASES = (
+    "année modèle", "annee modele",
+    "manufacturer's suggested retail price", "suggested retail price", "msrp",
+    "p.d.s.f", "pdsf",
+    "prix de base", "prix total",
+    "destination", "destination charge",
+    "frais d'expédition", "frais d expedition",
+)
+_RE_TITLE_BAD = _phrases_re(_TITLE_BAD_PHRASES)
+
+
 def extract_big_title(spans: List[Span]) -> Optional[str]:
     """
     Titre = plus gros texte (hauteur bbox) en haut du sticker.
@@ -475,15 +731,6 @@ def extract_big_title(spans: List[Span]) -> Optional[str]:
     max_y = max(sp.y1 for sp in spans)
     top_cut = max_y * 0.70
 
-    BAD = (
-        "année modèle", "annee modele",
-        "manufacturer's suggested retail price", "suggested retail price", "msrp",
-        "p.d.s.f", "pdsf",
-        "prix de base", "prix total",
-        "destination", "destination charge",
-        "frais d'expédition", "frais d expedition",
-    )
-
     cands: List[Tuple[float, str]] = []
     for ln in lines:
         if ln["y1"] < top_cut:
@@ -493,7 +740,7 @@ def extract_big_title(spans: List[Span]) -> Optional[str]:
         if not txt:
             continue
         low = txt.lower()
-        if any(b in low for b in BAD):
+        if _RE_TITLE_BAD.search(low):
             continue
         if not (8 <= len(txt) <= 90):
             continue
@@ -541,6 +788,27 @@ def ocr_extract_text(pdf_path: Path) -> str:
     return "\n".join(texts).strip()
 
 
+# ✅ titres qu'on ne veut JAMAIS voir comme options
+_OCR_BANNED_TITLES = (
+    "destination charge",
+    "freight",
+    "freight charge",
+    "shipping",
+    "tariff adjustment",
+    "msrp",
+    "manufacturer's suggested retail price",
+    "suggested retail price",
+    "p.d.s.f", "pdsf",
+    "prix total",
+    "total price",
+    "prix de base",
+    "base price",
+    "federal a/c excise tax",
+    "federal a c excise tax",  # OCR enlève souvent le slash
+)
+_RE_OCR_BANNED_TITLE = _phrases_re(_OCR_BANNED_TITLES)
+
+
 def extract_option_groups_from_ocr(text: str) -> List[Dict[str, Any]]:
     """
     OCR fallback: construit des groupes.
@@ -555,27 +823,6 @@ def extract_option_groups_from_ocr(text: str) -> List[Dict[str, Any]]:
     lines = [(normalize(x), indent_level(x)) for x in lines_raw]
     lines = [(t, ind) for (t, ind) in lines if t]
 
-    price_re = re.compile(r"(?i)(?:\$\s*)?(\d{1,3}(?:[,\s]\d{3})*(?:[.,]\d{2})?)\s*\$?")
-
-    # ✅ titres qu'on ne veut JAMAIS voir comme options
-    banned_titles = (
-        "destination charge",
-        "freight",
-        "freight charge",
-        "shipping",
-        "tariff adjustment",
-        "msrp",
-        "manufacturer's suggested retail price",
-        "suggested retail price",
-        "p.d.s.f", "pdsf",
-        "prix total",
-        "total price",
-        "prix de base",
-        "base price",
-        "federal a/c excise tax",
-        "federal a c excise tax",  # OCR enlève souvent le slash
-    )
-
     groups: List[Dict[str, Any]] = []
     current: Optional[Dict[str, Any]] = None
 
@@ -583,11 +830,11 @@ def extract_option_groups_from_ocr(text: str) -> List[Dict[str, Any]]:
         if is_hard_stop_detail(ln):
             break
 
-        m = price_re.search(ln)
+        m = _RE_PRICE.search(ln)
         if m:
             p = extract_price(ln)
 
-            title = price_re.sub("", ln).strip(" -–:•\t")
+            title = _RE_PRICE.sub("", ln).strip(" -–:•\t")
             title = clean_option_line(title)
 
             # ❌ skip titres vides / junk / prix-only / banned
@@ -596,10 +843,10 @@ def extract_option_groups_from_ocr(text: str) -> List[Dict[str, Any]]:
             if looks_like_junk(title):
                 continue
             # prix-only (ex: "$2,395")
-            if extract_price(title) and len(re.sub(r"[^A-Za-zÀ-ÿ]", "", title)) < 2:
+            if extract_price(title) and len(_RE_NON_LETTERS.sub("", title)) < 2:
                 continue
             lowt = title.lower()
-            if any(b in lowt for b in banned_titles):
+            if _RE_OCR_BANNED_TITLE.search(lowt):
                 continue
 
             if current:
@@ -615,7 +862,7 @@ def extract_option_groups_from_ocr(text: str) -> List[Dict[str, Any]]:
             if looks_like_junk(d):
                 continue
             # skip prix-only en détail
-            if extract_price(d) and len(re.sub(r"[^A-Za-zÀ-ÿ]", "", d)) < 2:
+            if extract_price(d) and len(_RE_NON_LETTERS.sub("", d)) < 2:
                 continue
             # si pas indenté et trop long, on skip (souvent du texte de bas de page)
             if ind < 2 and len(d) > 80:
@@ -729,7 +976,7 @@ def build_ad(
                 if looks_like_junk(dd):
                     continue
                 # skip prix-only
-                if extract_price(dd) and len(re.sub(r"[^A-Za-zÀ-ÿ]", "", dd)) < 2:
+                if extract_price(dd) and len(_RE_NON_LETTERS.sub("", dd)) < 2:
                     continue
                 lines.append(f"        ▫️ {dd}")
 
@@ -775,7 +1022,7 @@ def extract_option_groups_from_spans(spans: List[Span]) -> List[Dict[str, Any]]:
         low = (t or "").lower().strip()
         if looks_like_junk(t):
             return True
-        if re.fullmatch(r"[\d\s\-–—]+", t or ""):
+        if _RE_DIGITS_DASHES.fullmatch(t or ""):
             return True
         if any(k in low for k in ("expedier", "vendu", "concessionnaire", "dealer", "shipped", "sold")):
             return True
@@ -837,7 +1084,7 @@ def extract_option_groups_from_spans(spans: List[Span]) -> List[Dict[str, Any]]:
             continue
 
         # ✅ (2) skip lignes "prix seulement" (ex: "$2,395" ou "2,395 $")
-        if extract_price(text) and len(re.sub(r"[^A-Za-zÀ-ÿ]", "", text)) < 2:
+        if extract_price(text) and len(_RE_NON_LETTERS.sub("", text)) < 2:
             continue
 
         # ✅ (2) skip lignes junk (TOTAL PRICE, MSRP, etc.)
@@ -857,7 +1104,7 @@ def extract_option_groups_from_spans(spans: List[Span]) -> List[Dict[str, Any]]:
         # PRIX aligné -> TITRE (même si pas bold)
         if p is not None:
             # ✅ (3) refuser un "titre" qui est juste un prix
-            if extract_price(text) and len(re.sub(r"[^A-Za-zÀ-ÿ]", "", text)) < 2:
+            if extract_price(text) and len(_RE_NON_LETTERS.sub("", text)) < 2:
                 continue
             # ✅ (3) refuser titres junk
             if looks_like_junk(text):
@@ -922,13 +1169,10 @@ def extract_paid_options_from_text(txt: str) -> List[str]:
     - associe (zip)
     """
     raw_lines = (txt or "").splitlines()
-    lines = [re.sub(r"\s+", " ", l).strip() for l in raw_lines]
-
-    money_re = re.compile(r"(?i)(?:\$\s*)?(\d{1,3}(?:[,\s]\d{3})*(?:[.,]\d{2})?)\s*\$?")
-    price_only_re = re.compile(r"(?i)^\s*(?:\$\s*)?(\d{1,3}(?:[,\s]\d{3})*(?:[.,]\d{2})?)\s*\$?\s*$")
+    lines = [_RE_WS.sub(" ", l).strip() for l in raw_lines]
 
     def is_price_only(line: str) -> Optional[str]:
-        m = price_only_re.match(line or "")
+        m = _RE_PRICE_ONLY.match(line or "")
         if not m:
             return None
         raw = normalize(m.group(1)).replace(" ", "")
@@ -961,7 +1205,7 @@ def extract_paid_options_from_text(txt: str) -> List[str]:
             prices.append(p)
             continue
 
-        if money_re.search(l):
+        if _RE_PRICE.search(l):
             continue
 
         cand = clean_option_line(l)
@@ -1036,7 +1280,7 @@ def main() -> int:
     spans = extract_spans_pdfminer(unlocked, max_pages=2)
 
     # texte brut fallback -> 2 pages
-    page_txt = pdfminer_extract_text(str(unlocked), maxpages=2) or ""
+    page_txt = extract_text_pdfminer(unlocked, max_pages=2)
     is_hybrid = detect_hybrid_from_text(page_txt)
 
     # filtre marque (Stellantis)
@@ -1050,7 +1294,7 @@ def main() -> int:
 
     # Stock (sert aussi à fallback titre si besoin)
     auto_stock = pdf_path.parent.name or pdf_path.stem
-    stock = re.sub(r"\s+", "", (args.stock.strip() or auto_stock).strip()) or pdf_path.stem
+    stock = _RE_WS.sub("", (args.stock.strip() or auto_stock).strip()) or pdf_path.stem
 
     # Titre: priorité au site, sinon "gros titre" pdf, sinon stock
     auto_title = extract_big_title(spans) or ""
@@ -3,10 +3,53 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from supabase import create_client, Client
+from postgrest.types import ReturnMethod
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timezone
 import json
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------- Optional: orjson (JSON C plus rapide) ----------
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+
+# =========================
+# JSON
+# =========================
+def json_dumps_bytes(obj: Any, pretty: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    Sérialise en JSON UTF-8 (bytes). orjson si dispo, sinon json stdlib.
+    Types inconnus (datetime, Decimal...) -> str. sort_keys=True: sortie canonique (clés de cache/dédup).
+    """
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            opts |= orjson.OPT_INDENT_2
+        if sort_keys:
+            opts |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=opts, default=str)
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        indent=2 if pretty else None,
+        separators=None if pretty else (",", ":"),
+        sort_keys=sort_keys,
+        default=str,
+    ).encode("utf-8")
+
+
+def json_loads(data: bytes | str) -> Any:
+    """
+    Désérialise du JSON (bytes ou str). orjson si dispo, sinon json stdlib.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 # =========================
@@ -27,6 +70,9 @@ def get_client(url: str | None = None, key: str | None = None) -> Client:
         raise RuntimeError("Missing SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY")
 
     base = url.rstrip("/")
+    # PostgREST et Storage ouvrent déjà chacun leur httpx.Client en HTTP/2
+    # (httpx[http2] vient avec postgrest): les requêtes concurrentes des workers
+    # sont multiplexées sur une connexion TLS par client, rien à forcer ici.
     sb = create_client(base, key)
 
     # Force le endpoint Storage avec slash (évite le warning)
@@ -60,8 +106,19 @@ def upsert_inventory(sb: Client, rows: List[Dict[str, Any]]) -> None:
     if not cleaned:
         return
 
+    # Un même stock 2x dans un upsert bulk => erreur Postgres (ON CONFLICT ... a second
+    # time): le dernier gagne, comme en upserts successifs.
+    by_stock = {r["stock"]: r for r in cleaned}
+
+    # Un upsert bulk met à NULL les colonnes absentes d'une ligne: on groupe
+    # par jeu de colonnes (ex: MISSING/SOLD partiels vs ACTIVE complets)
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for r in by_stock.values():
+        groups.setdefault(tuple(sorted(r.keys())), []).append(r)
+
     # ✅ maintenant que DB a UNIQUE(stock), on upsert sur stock
-    sb.table("inventory").upsert(cleaned, on_conflict="stock").execute()
+    for group in groups.values():
+        sb.table("inventory").upsert(group, on_conflict="stock", returning=ReturnMethod.minimal).execute()
 
 
 def get_inventory_map(sb: Client) -> Dict[str, Dict[str, Any]]:
@@ -87,7 +144,7 @@ def upsert_post(sb: Client, row: Dict[str, Any]) -> None:
     # 1) Try stock (si l’index unique existe dans cette DB)
     if st:
         try:
-            sb.table("posts").upsert(row, on_conflict="stock").execute()
+            sb.table("posts").upsert(row, on_conflict="stock", returning=ReturnMethod.minimal).execute()
             return
         except APIError as e:
             msg = str(e).lower()
@@ -98,16 +155,155 @@ def upsert_post(sb: Client, row: Dict[str, Any]) -> None:
     # 2) Fallback slug (PK)
     if not slug:
         return
-    sb.table("posts").upsert(row, on_conflict="slug").execute()
+    sb.table("posts").upsert(row, on_conflict="slug", returning=ReturnMethod.minimal).execute()
+
+def upsert_posts(sb: Client, rows: List[Dict[str, Any]], chunk_size: int = 500) -> None:
+    """
+    Version bulk de upsert_post: un aller-retour par paquet au lieu d'un par ligne.
+    Les lignes sont groupées par jeu de colonnes (un upsert bulk met à NULL les
+    colonnes absentes d'une ligne). Si un paquet échoue, on repasse ligne par ligne
+    pour ne perdre que la ligne fautive.
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows or []:
+        if not row:
+            continue
+        st = (row.get("stock") or "").strip().upper()
+        if st:
+            row["stock"] = st
+        slug = (row.get("slug") or "").strip()
+        if slug:
+            row["slug"] = slug
+        if not st and not slug:
+            continue
+        groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+
+    for group in groups.values():
+        for i in range(0, len(group), max(1, chunk_size)):
+            batch = group[i:i + chunk_size]
+            conflict = "stock" if all(r.get("stock") for r in batch) else "slug"
+            try:
+                try:
+                    sb.table("posts").upsert(batch, on_conflict=conflict, returning=ReturnMethod.minimal).execute()
+                except APIError as e:
+                    msg = str(e).lower()
+                    if conflict != "stock" or ("42p10" not in msg and "no unique" not in msg):
+                        raise
+                    if not all(r.get("slug") for r in batch):
+                        raise
+                    sb.table("posts").upsert(batch, on_conflict="slug", returning=ReturnMethod.minimal).execute()
+            except Exception as e:
+                print(f"[WARN] upsert_posts batch failed ({len(batch)} rows), per-row fallback: {e}", flush=True)
+                for r in batch:
+                    try:
+                        upsert_post(sb, r)
+                    except Exception as e2:
+                        print(f"[WARN] upsert_post failed slug={r.get('slug')}: {e2}", flush=True)
+
+
+def update_posts_by_post_id(sb: Client, updates: Dict[str, Dict[str, Any]], workers: int = 8) -> Dict[str, str]:
+    """
+    UPDATE posts SET <champs> WHERE post_id = <clé>, pour chaque entrée de `updates`.
+    Update-only: une ligne absente n'est jamais créée (contrairement à upsert_posts).
+    PostgREST n'a pas d'UPDATE multi-lignes à valeurs distinctes: les requêtes partent
+    en parallèle sur un petit pool. Retourne {post_id: erreur} pour les échecs.
+    """
+    def _one(item):
+        post_id, fields = item
+        try:
+            sb.table("posts").update(fields, returning=ReturnMethod.minimal).eq("post_id", post_id).execute()
+            return post_id, None
+        except Exception as e:
+            return post_id, str(e)
 
-def get_posts_map(sb: Client) -> Dict[str, Dict[str, Any]]:
-    res = sb.table("posts").select("*").execute()
+    items = [(pid, f) for pid, f in (updates or {}).items() if pid and f]
+    if not items:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as pool:
+        return {pid: err for pid, err in pool.map(_one, items) if err is not None}
+
+
+def get_posts_map(sb: Client, columns: str = "*") -> Dict[str, Dict[str, Any]]:
+    """
+    slug -> post. `columns` permet de ne rapatrier que les colonnes utiles
+    (ex: base_text est lourd et pas toujours nécessaire). slug est toujours inclus.
+    """
+    if columns != "*" and "slug" not in [c.strip() for c in columns.split(",")]:
+        columns = "slug," + columns
+    res = sb.table("posts").select(columns).execute()
     data = res.data or []
     return {r["slug"]: r for r in data if r.get("slug")}
 
 
 def log_event(sb: Client, slug: str, typ: str, payload: Dict[str, Any]) -> None:
-    sb.table("events").insert({"slug": slug, "type": typ, "payload": payload}).execute()
+    sb.table("events").insert({"slug": slug, "type": typ, "payload": payload}, returning=ReturnMethod.minimal).execute()
+
+
+def _dedupe_events(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fusionne les events identiques (slug, type, payload), ordre de 1re apparition.
+    Les doublons reçoivent payload["dup_count"] = nombre d'occurrences.
+    """
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    counts: Dict[tuple, int] = {}
+    for row in rows:
+        try:
+            key = (row.get("slug"), row.get("type"), json_dumps_bytes(row.get("payload"), sort_keys=True))
+        except Exception:
+            key = (row.get("slug"), row.get("type"), id(row))
+        if key in merged:
+            counts[key] += 1
+        else:
+            merged[key] = row
+            counts[key] = 1
+
+    out: List[Dict[str, Any]] = []
+    for key, row in merged.items():
+        if counts[key] > 1:
+            row = {**row, "payload": {**(row.get("payload") or {}), "dup_count": counts[key]}}
+        out.append(row)
+    return out
+
+
+class BufferedEventLog:
+    """
+    log_event bufferisé: les events sont gardés en mémoire et insérés en bulk
+    (un aller-retour par `cap` events, puis flush() en fin de run).
+    Thread-safe (appelé depuis les workers du runner).
+    dedupe=True: les events strictement identiques (slug, type, payload) d'un même
+    paquet deviennent une seule ligne avec payload["dup_count"].
+    """
+    def __init__(self, sb: Client, cap: int = 256, dedupe: bool = True):
+        self.sb = sb
+        self.cap = max(1, int(cap))
+        self.dedupe = dedupe
+        self.buf: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def log(self, slug: str, typ: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self.buf.append({"slug": slug, "type": typ, "payload": payload})
+            full = len(self.buf) >= self.cap
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self.buf = self.buf, []
+        if not batch:
+            return
+        if self.dedupe:
+            batch = _dedupe_events(batch)
+        try:
+            self.sb.table("events").insert(batch, returning=ReturnMethod.minimal).execute()
+        except Exception as e:
+            # Un event invalide ne doit pas faire perdre tout le paquet
+            print(f"[WARN] events bulk insert failed ({len(batch)} rows), per-row fallback: {e}", flush=True)
+            for row in batch:
+                try:
+                    self.sb.table("events").insert(row, returning=ReturnMethod.minimal).execute()
+                except Exception as e2:
+                    print(f"[WARN] log_event failed slug={row.get('slug')} type={row.get('type')}: {e2}", flush=True)
 
 
 # =========================
@@ -133,6 +329,7 @@ def upsert_scrape_run(sb: Client, run_id: str, status: str = "OK", note: str = "
             "note": (note or None),
         },
         on_conflict="run_id",
+        returning=ReturnMethod.minimal,
     ).execute()
 
 
@@ -154,6 +351,7 @@ def upsert_raw_page(sb: Client, run_id: str, page_no: int, storage_path: str, da
             "sha256": sha256_hex(data or b""),
         },
         on_conflict="run_id,page_no",
+        returning=ReturnMethod.minimal,
     ).execute()
 
 
@@ -189,6 +387,7 @@ def upsert_sticker_pdf(
             "updated_at": utc_now_iso(),
         },
         on_conflict="vin",
+        returning=ReturnMethod.minimal,
     ).execute()
 
 
@@ -210,6 +409,7 @@ def upsert_output(
             "updated_at": utc_now_iso(),
         },
         on_conflict="stock,kind",
+        returning=ReturnMethod.minimal,
     ).execute()
 
 # =========================
@@ -249,7 +449,7 @@ def upload_json_to_storage(
     obj: Any,
     upsert: bool = True,
 ) -> None:
-    b = json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    b = json_dumps_bytes(obj, pretty=True)
     upload_bytes_to_storage(
         sb,
         bucket,
@@ -274,11 +474,81 @@ def read_json_from_storage(
     except Exception:
         return None
     try:
-        return json.loads(blob.decode("utf-8", errors="replace"))
+        return json_loads(blob)
+    except Exception:
+        pass
+    # UTF-8 invalide: on retombe sur un décodage tolérant
+    try:
+        return json_loads(blob.decode("utf-8", errors="replace"))
     except Exception:
         return None
 
 
+def _list_storage_items(sb, bucket: str, prefix: str, page_size: int = 1000) -> List[Dict[str, Any]]:
+    """Tous les objets (dicts Storage: name, created_at, ...) directement sous bucket/prefix, paginé."""
+    bucket = (bucket or "").strip()
+    prefix = (prefix or "").strip().strip("/")
+    out: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        items = sb.storage.from_(bucket).list(prefix, {"limit": page_size, "offset": offset}) or []
+        out.extend(it for it in items if it and it.get("name"))
+        if len(items) < page_size:
+            return out
+        offset += page_size
+
+
+def list_storage_names(sb, bucket: str, prefix: str, page_size: int = 1000) -> List[str]:
+    """
+    Liste TOUS les noms d'objets directement sous bucket/prefix (paginé).
+    (list() de Storage plafonne à 100 entrées par défaut)
+    Lève l'exception Storage en cas d'erreur: à l'appelant de décider du fallback.
+    """
+    return [it["name"] for it in _list_storage_items(sb, bucket, prefix, page_size)]
+
+
+def cleanup_storage_older_than(sb, bucket: str, prefix: str, max_age_days: int) -> int:
+    """
+    Supprime les fichiers directement sous bucket/prefix créés il y a plus de
+    `max_age_days` jours (dossier plat, ex: caches). max_age_days <= 0 => rien.
+    Retourne le nombre de fichiers supprimés (best effort, jamais d'exception).
+    """
+    bucket = (bucket or "").strip()
+    prefix = (prefix or "").strip().strip("/")
+    if not bucket or not prefix or max_age_days <= 0:
+        return 0
+
+    try:
+        items = _list_storage_items(sb, bucket, prefix)
+    except Exception:
+        return 0
+
+    cutoff = datetime.now(timezone.utc).timestamp() - max_age_days * 86400
+    old: List[str] = []
+    for it in items:
+        ts = it.get("created_at") or it.get("updated_at")
+        if not ts or not it.get("id"):  # pas de date / sous-dossier => on garde
+            continue
+        try:
+            created = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        if created.timestamp() < cutoff:
+            old.append(f"{prefix}/{it['name']}")
+
+    removed = 0
+    for i in range(0, len(old), 1000):
+        chunk = old[i:i + 1000]
+        try:
+            sb.storage.from_(bucket).remove(chunk)
+            removed += len(chunk)
+        except Exception:
+            pass
+    return removed
+
+
 def cleanup_storage_runs(sb, bucket: str, prefix: str, keep: int = 5) -> None:
     """
     Supprime récursivement les vieux runs dans Storage bucket/prefix/<run_id>/...
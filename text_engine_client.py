@@ -1,5 +1,21 @@
+import os
 import time
 import requests
+from requests.adapters import HTTPAdapter
+
+from supabase_db import json_dumps_bytes, json_loads
+
+# Session partagée (keep-alive): un seul handshake TCP+TLS vers le text-engine par
+# worker au lieu d'un par génération. Pas de Retry urllib3: POST + boucle d'essais ci-dessous.
+TEXT_ENGINE_POOL_SIZE = int(os.getenv("KENBOT_TEXT_ENGINE_POOL_SIZE", "8").strip() or "8")
+
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=TEXT_ENGINE_POOL_SIZE, pool_maxsize=TEXT_ENGINE_POOL_SIZE)
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
+
+# Marqueur du texte de secours (ne jamais le mettre en cache côté appelant)
+FALLBACK_MARKER = "⚠️ Mode secours (text-engine indisponible)"
 
 def generate_facebook_text(base_url: str, slug: str, event: str, vehicle: dict) -> str:
     url = f"{base_url.rstrip('/')}/generate"
@@ -8,9 +24,14 @@ def generate_facebook_text(base_url: str, slug: str, event: str, vehicle: dict)
     last_err = None
     for attempt in range(1, 4):  # 3 essais
         try:
-            r = requests.post(url, json=payload, timeout=120)
+            r = SESSION.post(
+                url,
+                data=json_dumps_bytes(payload),
+                headers={"Content-Type": "application/json"},
+                timeout=120,
+            )
             r.raise_for_status()
-            j = r.json()
+            j = json_loads(r.content)
             # ton service renvoie souvent facebook_text
             txt = (j.get("facebook_text") or j.get("text") or "").strip()
             if txt:
@@ -29,5 +50,5 @@ def generate_facebook_text(base_url: str, slug: str, event: str, vehicle: dict)
         f"🧾 Stock : {v.get('stock','')}\n"
         f"🔢 VIN : {v.get('vin','')}\n\n"
         f"{v.get('url','')}\n"
-        f"\n⚠️ Mode secours (text-engine indisponible)"
+        f"\n{FALLBACK_MARKER}"
     )